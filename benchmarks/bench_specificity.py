@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Benchmark rules.rule_specificity on large synthetic groups
+
+Compares the sort-based implementation with the previous pairwise one, kept as a
+reference in tests/test_rules.py, which is only run for groups small enough to
+finish in reasonable time.
+
+    PYTHONPATH=. python benchmarks/bench_specificity.py [SIZE...]
+"""
+
+import random
+import sys
+import time
+
+from kamaji.uniq import ActionType, DupGroup
+from kamaji.uniq.rules import rule_specificity
+from tests.test_rules import pairwise_specificity as rule_specificity_pairwise
+
+# pairwise comparison is skipped above this size
+PAIRWISE_MAX = 5000
+
+
+def synthetic_group(size, seed=0):
+    """Copies of one file scattered over a random directory tree"""
+    rng = random.Random(seed)
+    dirs = ["/photos"]
+    paths = []
+    for i in range(size):
+        parent = rng.choice(dirs)
+        if rng.random() < 0.3:
+            parent = "{}/d{}".format(parent, i)
+            dirs.append(parent)
+        paths.append("{}/icon{}.png".format(parent, i))
+    return paths
+
+
+def timed(rule, paths):
+    group = DupGroup(paths=paths)
+    start = time.perf_counter()
+    rule(group)
+    return time.perf_counter() - start, group.annotation
+
+
+def main(sizes):
+    print(
+        "{:>8} {:>12} {:>12} {:>8}".format(
+            "size", "sorted (s)", "pairwise (s)", "speedup"
+        )
+    )
+    for size in sizes:
+        paths = synthetic_group(size)
+        fast, annotation = timed(rule_specificity, paths)
+        if size <= PAIRWISE_MAX:
+            slow, expected = timed(rule_specificity_pairwise, paths)
+            assert annotation == expected, "annotations differ"
+            print(
+                "{:8d} {:12.4f} {:12.4f} {:7.0f}x".format(size, fast, slow, slow / fast)
+            )
+        else:
+            print("{:8d} {:12.4f} {:>12} {:>8}".format(size, fast, "skipped", "-"))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10, 1000, 100000])
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""Check that the kamaji command starts quickly
+
+Each command is run several times in a fresh interpreter and the median wall time
+is compared with a budget. The modules imported by each `--help` are also checked,
+since subcommands and optional subsystems should only be imported when they are
+used. Exits with status 1 if any check fails.
+
+    python benchmarks/bench_startup.py [--budget SECONDS] [-n RUNS]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# (name, arguments of python, whether the budget applies)
+COMMANDS = [
+    ("python", ["-c", "pass"], False),
+    ("kamaji --help", ["-m", "kamaji", "--help"], True),
+    ("kamaji sort --help", ["-m", "kamaji", "sort", "--help"], True),
+    ("kamaji uniq --help", ["-m", "kamaji", "uniq", "--help"], True),
+]
+# modules which each command must not import
+LAZY = [
+    (
+        "kamaji --help",
+        ["-m", "kamaji", "--help"],
+        ["kamaji.sort", "kamaji.uniq", "asyncio", "sqlite3", "distutils"],
+    ),
+    (
+        "kamaji sort --help",
+        ["-m", "kamaji", "sort", "--help"],
+        ["kamaji.uniq", "kamaji.journal", "asyncio", "sqlite3"],
+    ),
+    (
+        "kamaji uniq --help",
+        ["-m", "kamaji", "uniq", "--help"],
+        ["kamaji.sort", "asyncio", "sqlite3", "PIL", "multiprocessing"],
+    ),
+]
+
+
+def timeit(args, runs):
+    """Median wall time of running python with args"""
+    times = []
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable] + args,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def imported(args):
+    """Modules imported by running python with args, from -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + args,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    # "import time: self [us] | cumulative | imported package"
+    return {
+        line.rsplit("|", 1)[1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and "|" in line
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=0.3,
+        help="maximum median seconds for each kamaji command",
+    )
+    parser.add_argument("-n", "--runs", type=int, default=7, help="runs per command")
+    opts = parser.parse_args(argv)
+
+    ok = True
+    print("{:<24} {:>10} {:>8}".format("command", "time (s)", "budget"))
+    for name, args, budgeted in COMMANDS:
+        elapsed = timeit(args, opts.runs)
+        status = ""
+        if budgeted:
+            status = "ok" if elapsed <= opts.budget else "OVER"
+            ok = ok and elapsed <= opts.budget
+        print("{:<24} {:10.3f} {:>8}".format(name, elapsed, status))
+
+    for name, args, lazymodules in LAZY:
+        eager = sorted(
+            module
+            for module in imported(args)
+            if any(
+                module == lazy or module.startswith(lazy + ".") for lazy in lazymodules
+            )
+        )
+        if eager:
+            ok = False
+            print(name + " imported: " + ", ".join(eager))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    # run the kamaji in this tree, even without PYTHONPATH
+    os.environ["PYTHONPATH"] = os.pathsep.join(
+        filter(
+            None,
+            [
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                os.environ.get("PYTHONPATH"),
+            ],
+        )
+    )
+    sys.exit(main())
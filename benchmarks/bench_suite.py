@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""Benchmark the main stages of `kamaji sort` and `kamaji uniq`
+
+Inputs are generated in a temporary directory (see `synthetic.py`) and exiftool
+is replaced by `exiftool_stub.py`, so no network or exiftool installation is
+needed. Each stage runs twice on fresh inputs: once for the time, and once under
+tracemalloc for the peak memory of the Python heap. Memory used by exiftool
+processes is not included.
+
+    PYTHONPATH=. python benchmarks/bench_suite.py [--photos N] [--groups N]
+"""
+
+import argparse
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# must be set before kamaji.sort is imported
+os.environ["EXIFTOOL"] = os.path.join(HERE, "exiftool_stub.py")
+
+from kamaji.sort.sort import PhotoSorter  # noqa: E402
+from kamaji.uniq import DupList  # noqa: E402
+from kamaji.uniq.rules import defaultrules  # noqa: E402
+
+sys.path.insert(0, HERE)
+import synthetic  # noqa: E402
+
+
+class Stage(object):
+    """A benchmarked operation
+
+    `setup()` returns the arguments of `run(*args)` and the number of items
+    processed; it is called before each run and not timed.
+    """
+
+    def __init__(self, name, setup, run):
+        self.name = name
+        self.setup = setup
+        self.run = run
+
+    def measure(self):
+        """Returns: (items, seconds, peak bytes)"""
+        args, items = self.setup()
+        start = time.perf_counter()
+        self.run(*args)
+        elapsed = time.perf_counter() - start
+
+        args, items = self.setup()
+        tracemalloc.start()
+        try:
+            self.run(*args)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return items, elapsed, peak
+
+
+def sort_stages(tmp, opts):
+    def setup():
+        root = tempfile.mkdtemp(dir=tmp)
+        src = os.path.join(root, "src")
+        files, _ = synthetic.photo_tree(src, opts.photos, conflicts=opts.conflicts)
+        return (src, os.path.join(root, "dst")), files
+
+    def sortphotos(native):
+        def run(src, dst):
+            sorter = PhotoSorter(native=native, jobs=opts.jobs)
+            sorter.sortphotos(src, dst)
+
+        return run
+
+    return [
+        Stage("sortphotos (native)", setup, sortphotos(True)),
+        Stage("sortphotos (exiftool)", setup, sortphotos(False)),
+    ]
+
+
+def uniq_stages(tmp, opts):
+    root = os.path.join(tmp, "dups")
+    groups = synthetic.duplicate_groups(root, opts.groups, opts.group_size)
+    nfiles = sum(len(g) for g in groups)
+    report = os.path.join(tmp, "fslint.txt")
+    synthetic.fslint_report(report, groups)
+    with open(report) as f:
+        annotated = DupList(fslint=f)
+    annotated.annotate(defaultrules)
+    tsv = io.StringIO()
+    annotated.write(tsv)
+    tsv = tsv.getvalue()
+
+    def parse_setup():
+        return (report,), nfiles
+
+    def parse(path):
+        with open(path) as f:
+            DupList.fslint_duplist(DupList.parse_fslint(f))
+
+    def iter_fslint(path):
+        with open(path) as f:
+            DupList(fslint=f)
+
+    def iter_fslint_compact(path):
+        with open(path) as f:
+            DupList(fslint=f, compact=True)
+
+    def annotate_setup():
+        with open(report) as f:
+            return (DupList(fslint=f),), nfiles
+
+    def read_setup():
+        return (io.StringIO(tsv),), nfiles
+
+    def write_setup():
+        return (annotated, io.StringIO()), nfiles
+
+    def apply_setup():
+        return (annotated,), nfiles
+
+    return [
+        Stage("parse_fslint", parse_setup, parse),
+        Stage("iter_fslint", parse_setup, iter_fslint),
+        Stage("iter_fslint (compact)", parse_setup, iter_fslint_compact),
+        Stage("annotate", annotate_setup, lambda dups: dups.annotate(defaultrules)),
+        Stage("read_tsv", read_setup, lambda f: DupList(tsv=f)),
+        Stage("write", write_setup, lambda dups, f: dups.write(f)),
+        Stage("apply(dryrun=True)", apply_setup, lambda dups: dups.apply(dryrun=True)),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--photos", type=int, default=2000, help="JPEGs to sort")
+    parser.add_argument(
+        "--conflicts",
+        type=float,
+        default=0.05,
+        help="fraction of JPG+CR2 pairs with conflicting dates",
+    )
+    parser.add_argument("--groups", type=int, default=20000, help="duplicate groups")
+    parser.add_argument("--group-size", type=int, default=3, help="files per group")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="sort threads")
+    parser.add_argument("--only", help="run stages whose name contains this")
+    parser.add_argument("--tmp", help="directory for generated inputs")
+    opts = parser.parse_args(argv)
+
+    # moves and actions are logged at INFO, conflicting dates as warnings
+    logging.basicConfig(level=logging.ERROR)
+
+    tmp = tempfile.mkdtemp(prefix="kamaji-bench-", dir=opts.tmp)
+    try:
+        stages = sort_stages(tmp, opts) + uniq_stages(tmp, opts)
+        print(
+            "{:<24} {:>9} {:>10} {:>12} {:>10}".format(
+                "stage", "items", "time (s)", "items/s", "peak (MB)"
+            )
+        )
+        for stage in stages:
+            if opts.only and opts.only not in stage.name:
+                continue
+            items, elapsed, peak = stage.measure()
+            print(
+                "{:<24} {:9d} {:10.3f} {:12.0f} {:10.1f}".format(
+                    stage.name, items, elapsed, items / elapsed, peak / 1e6
+                )
+            )
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
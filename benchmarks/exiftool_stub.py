@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Stand-in for exiftool, so benchmarks run offline
+
+Implements the subset of exiftool used by `kamaji.sort`: one-off calls and
+`-stay_open True -@ -`, plain output of "Create Date" and `-json` output of the
+date tags, formatted as `YYYY:MM`. Dates are read with `kamaji.sort.exif`.
+
+    EXIFTOOL=benchmarks/exiftool_stub.py kamaji sort ...
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kamaji.sort.exif import read_dates  # noqa: E402
+
+# options taking a value
+VALUED = {"-d", "-stay_open", "-@"}
+
+
+def run(args, out):
+    files = []
+    jsonout = False
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in VALUED:
+            i += 1
+        elif arg == "-json":
+            jsonout = True
+        elif arg == "--":
+            files.extend(args[i + 1 :])
+            break
+        elif not arg.startswith("-"):
+            files.append(arg)
+        i += 1
+
+    records = []
+    for f in files:
+        try:
+            dates = sorted(read_dates(f) or ())
+        except OSError:
+            dates = []
+        record = {"SourceFile": f}
+        if dates:
+            record["CreateDate"] = record["DateTimeOriginal"] = "%s:%s" % dates[0]
+        records.append(record)
+    if jsonout:
+        out.write(json.dumps(records, indent=1) + "\n")
+    else:
+        for record in records:
+            if "CreateDate" in record:
+                out.write("Create Date : %s:01 00:00:00\n" % record["CreateDate"])
+
+
+def main(argv):
+    if "-stay_open" not in argv:
+        run(argv, sys.stdout)
+        return
+    args = []
+    for line in sys.stdin:
+        line = line.rstrip("\n")
+        if line.startswith("-execute"):
+            run(args, sys.stdout)
+            sys.stdout.write("{ready}\n")
+            sys.stdout.flush()
+            args = []
+        elif line == "-stay_open":
+            continue
+        elif line == "False":
+            break
+        else:
+            args.append(line)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
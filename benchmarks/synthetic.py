@@ -0,0 +1,161 @@
+"""Synthetic inputs for the benchmarks
+
+Photo trees contain minimal JPEG and CR2 files carrying only the EXIF date tags
+read by `kamaji.sort`. fslint reports list groups of (empty) files spread over
+directories resembling a photo collection, so the default rules have something
+to decide. All generators are seeded and reproducible.
+"""
+
+import os
+import random
+import struct
+from typing import List, Tuple
+
+# Directories for duplicates, chosen so each default rule applies to some groups
+DUP_DIRS = (
+    "Pictures/{year}",
+    "Pictures/{year}/{month}",
+    "Pictures/{year}/{month}/best",
+    "Unsorted/camera",
+    "backup/rsync/Pictures/{year}",
+    "phone/DCIM",
+    "iPhoto Library/Masters/{year}",
+)
+
+
+def tiff(date: str, endian=">", cr2=False) -> bytes:
+    """A TIFF file with CreateDate and DateTimeOriginal set to date
+
+    Args:
+    - date: EXIF date, "YYYY:MM:DD HH:MM:SS"
+    - endian: "<" (Intel) or ">" (Motorola) byte order
+    - cr2: add the Canon raw header, giving a minimal CR2 file
+    """
+    value = date.encode("ascii") + b"\0"
+    ifd0 = 16 if cr2 else 8
+    exififd = ifd0 + 2 + 12 + 4
+    data = exififd + 2 + 2 * 12 + 4
+    header = (b"II*\0" if endian == "<" else b"MM\0*") + struct.pack(endian + "I", ifd0)
+    if cr2:
+        header += b"CR\x02\x00" + struct.pack(endian + "I", 0)
+    return b"".join(
+        (
+            header,
+            # IFD0, pointing to the EXIF IFD
+            struct.pack(endian + "H", 1),
+            struct.pack(endian + "HHII", 0x8769, 4, 1, exififd),
+            struct.pack(endian + "I", 0),
+            # EXIF IFD with DateTimeOriginal and CreateDate
+            struct.pack(endian + "H", 2),
+            struct.pack(endian + "HHII", 0x9003, 2, len(value), data),
+            struct.pack(endian + "HHII", 0x9004, 2, len(value), data + len(value)),
+            struct.pack(endian + "I", 0),
+            value,
+            value,
+        )
+    )
+
+
+def jpeg(date: str, padding=1024) -> bytes:
+    """A JPEG file with an EXIF segment and `padding` bytes of scan data"""
+    app1 = b"Exif\0\0" + tiff(date, "<")
+    return b"".join(
+        (
+            b"\xff\xd8\xff\xe1",
+            struct.pack(">H", len(app1) + 2),
+            app1,
+            b"\xff\xda\x00\x02",
+            b"\x00" * padding,
+            b"\xff\xd9",
+        )
+    )
+
+
+def photo_tree(
+    root: str, photos: int, raw=0.3, conflicts=0.05, per_dir=200, seed=0
+) -> Tuple[int, int]:
+    """Write a tree of dated photos
+
+    Args:
+    - root: directory to create the photos in
+    - photos: number of JPEGs
+    - raw: fraction of JPEGs with a CR2 file of the same name
+    - conflicts: fraction of JPG+CR2 pairs whose dates differ, which sortphotos
+      leaves in place
+    - per_dir: photos per directory
+    - seed: random seed
+
+    Returns: (files, conflicting groups)
+    """
+    rng = random.Random(seed)
+    files = 0
+    conflicting = 0
+    for i in range(photos):
+        dirpath = os.path.join(root, "import{:04d}".format(i // per_dir))
+        if i % per_dir == 0:
+            os.makedirs(dirpath, exist_ok=True)
+        date = "{}:{:02d}:{:02d} 12:00:00".format(
+            rng.randint(2000, 2020), rng.randint(1, 12), rng.randint(1, 28)
+        )
+        base = os.path.join(dirpath, "IMG_{:05d}".format(i))
+        with open(base + ".jpg", "wb") as f:
+            f.write(jpeg(date))
+        files += 1
+        if rng.random() < raw:
+            rawdate = date
+            if rng.random() < conflicts:
+                rawdate = "1999" + date[4:]
+                conflicting += 1
+            with open(base + ".CR2", "wb") as f:
+                f.write(tiff(rawdate, cr2=True))
+            files += 1
+    return files, conflicting
+
+
+def duplicate_groups(
+    root: str, groups: int, size=3, create=True, seed=0
+) -> List[List[str]]:
+    """Invent groups of duplicate files
+
+    Args:
+    - root: directory containing the files
+    - groups: number of groups
+    - size: average number of files per group (at least 2)
+    - create: create the files (empty), as applying actions checks they exist
+    - seed: random seed
+
+    Returns: list of groups of paths
+    """
+    rng = random.Random(seed)
+    result = []
+    made = set()
+    for i in range(groups):
+        year = rng.randint(2000, 2020)
+        month = "{:02d}".format(rng.randint(1, 12))
+        dirs = rng.sample(
+            DUP_DIRS, min(len(DUP_DIRS), max(2, rng.randint(2, size * 2 - 2)))
+        )
+        name = "IMG_{:06d}.jpg".format(i)
+        paths = []
+        for d in dirs:
+            dirpath = os.path.join(root, d.format(year=year, month=month))
+            if create and dirpath not in made:
+                os.makedirs(dirpath, exist_ok=True)
+                made.add(dirpath)
+            path = os.path.join(dirpath, name)
+            if create:
+                open(path, "w").close()
+            paths.append(path)
+        result.append(paths)
+    return result
+
+
+def fslint_report(path: str, groups: List[List[str]]):
+    """Write groups of duplicates in fslint's format"""
+    with open(path, "w") as f:
+        f.write("-----------------------------------file name lint\n")
+        f.write("-------------------------------DUPlicate files\n")
+        for paths in groups:
+            f.write("\n".join(paths))
+            f.write("\n\n")
+        f.write("-----------------------------------Empty files\n")
@@ -1,22 +1,80 @@
 import click
+import importlib
+import logging
 
-from .sort.__main__ import main as sort
-from .uniq.__main__ import main as uniq
 
+class LazyGroup(click.Group):
+    """Group whose subcommands are imported only when they are run
 
-@click.group()
+    Each lazy subcommand is given as (module, attribute, short help). The help
+    is listed by `--help` without importing the module.
+    """
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, name):
+        command = super().get_command(ctx, name)
+        if command is None and name in self.lazy_commands:
+            module, attribute, _ = self.lazy_commands[name]
+            command = getattr(importlib.import_module(module), attribute)
+            self.add_command(command, name)
+        return command
+
+    def format_commands(self, ctx, formatter):
+        rows = []
+        for name in self.list_commands(ctx):
+            if name in self.commands:
+                command = self.commands[name]
+                if command.hidden:
+                    continue
+                rows.append((name, command.get_short_help_str(formatter.width)))
+            else:
+                rows.append((name, self.lazy_commands[name][2]))
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+
+@click.group(
+    cls=LazyGroup,
+    lazy_commands={
+        "sort": ("kamaji.sort.__main__", "main", "Sort images by year and month"),
+        "uniq": ("kamaji.uniq.__main__", "main", "Deal with duplicate images"),
+    },
+)
 @click.help_option("-h", "--help")
 def main():
     pass
 
 
 @click.command()
-def uniq():
-    pass
+@click.argument("journal", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-n",
+    "--dry-run",
+    is_flag=True,
+    default=False,
+    help="Do not actually perform file moves",
+)
+@click.option("-v", "--verbose", is_flag=True, help="Verbose logging")
+@click.help_option("-h", "--help")
+def rollback(journal, dry_run, verbose):
+    "Undo the operations recorded in a sort or uniq journal"
+
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO)
+    from .journal import Journal
+
+    with Journal(journal, resume=True) as j:
+        count = j.rollback(dry_run=dry_run)
+    logging.info("Undid %d operations", count)
 
 
-main.add_command(sort, "sort")
-main.add_command(uniq, "uniq")
+main.add_command(rollback, "rollback")
 
 if __name__ == "__main__":
     main()
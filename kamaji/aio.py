@@ -0,0 +1,197 @@
+"""asyncio core for file operations
+
+On network file systems each `stat`, `rename` or `unlink` waits for a round trip,
+so throughput depends on how many requests are in flight rather than on
+bandwidth. `AsyncFS` runs blocking file operations in a thread pool from
+coroutines. Each operation counts against a semaphore for the mount holding its
+path, so a slow NAS can have many requests in flight while a local disk isn't
+flooded.
+
+The synchronous code paths (`PhotoSorter.movegroup`, `Action.apply`) do the actual
+work. This module only decides how many of them run at once.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# operations in flight per mount, unless configured otherwise
+LIMIT = 16
+
+
+def _unescape(field: str) -> str:
+    """Decode the octal escapes (e.g. \\040 for space) of /proc/self/mounts"""
+    if "\\" not in field:
+        return field
+    return field.encode().decode("unicode_escape").encode("latin-1").decode()
+
+
+def mounts() -> List[str]:
+    """Mount points, longest first
+
+    Read from /proc/self/mounts where available; otherwise only "/" is listed, and
+    `mountpoint` falls back to `os.path.ismount`.
+    """
+    try:
+        with open("/proc/self/mounts") as f:
+            points = {_unescape(line.split()[1]) for line in f if line.strip()}
+    except OSError:
+        points = {os.sep}
+    return sorted(points, key=len, reverse=True)
+
+
+def mountpoint(path: str, points: Optional[List[str]] = None) -> str:
+    """Mount point of the file system holding path
+
+    Symbolic links are not resolved, so a link to another file system is counted
+    against the mount holding the link.
+
+    Args:
+        - path (str): file name, which need not exist
+        - points (list of str): mount points from `mounts()`
+    """
+    path = os.path.abspath(path)
+    if points is None:
+        points = mounts()
+    if points == [os.sep]:
+        while not os.path.ismount(path):
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+        return path
+    for point in points:
+        if path == point or path.startswith(point.rstrip(os.sep) + os.sep):
+            return point
+    return os.sep
+
+
+def parse_limits(specs: Iterable[str]) -> Tuple[int, Dict[str, int]]:
+    """Parse concurrency limits given as `N` (the default) or `MOUNT=N`
+
+    Returns: (default limit, dict of mount point -> limit)
+
+    Raises: (ValueError) for malformed limits
+    """
+    default = LIMIT
+    limits = {}
+    for spec in specs:
+        path, sep, value = spec.rpartition("=")
+        try:
+            n = int(value)
+        except ValueError:
+            raise ValueError("Invalid limit: %s" % spec) from None
+        if n < 1:
+            raise ValueError("Limits must be positive: %s" % spec)
+        if sep:
+            limits[os.path.abspath(path)] = n
+        else:
+            default = n
+    return default, limits
+
+
+class AsyncFS(object):
+    """Runs blocking file operations in threads, limited per mount
+
+    Coroutines must all run on the same event loop.
+    """
+
+    def __init__(
+        self,
+        limit: int = LIMIT,
+        limits: Optional[Dict[str, int]] = None,
+        threads: Optional[int] = None,
+    ):
+        """
+        Args:
+            - limit (int): operations in flight per mount
+            - limits (dict): limits for particular mount points, overriding `limit`
+            - threads (int): size of the thread pool (default: enough for two
+              mounts at their limits)
+        """
+        self.limit = limit
+        self.limits = {os.path.abspath(k): v for k, v in (limits or {}).items()}
+        if threads is None:
+            threads = 2 * max([limit] + list(self.limits.values()))
+        self.executor = ThreadPoolExecutor(threads)
+        self.points = mounts()
+        # directory -> mount point
+        self.mountcache: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        # created on the event loop
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def mount(self, path: str) -> str:
+        """Mount point of path, cached per directory"""
+        directory = os.path.dirname(os.path.abspath(path))
+        with self.lock:
+            point = self.mountcache.get(directory)
+            if point is None:
+                point = self.mountcache[directory] = mountpoint(directory, self.points)
+        return point
+
+    def semaphore(self, path: str) -> asyncio.Semaphore:
+        """Semaphore limiting operations on the mount holding path"""
+        point = self.mount(path)
+        semaphore = self.semaphores.get(point)
+        if semaphore is None:
+            semaphore = self.semaphores[point] = asyncio.Semaphore(
+                self.limits.get(point, self.limit)
+            )
+        return semaphore
+
+    async def call(self, path: str, func: Callable[..., T], *args) -> T:
+        """Run func(*args) in a thread, counting against the mount of path"""
+        loop = asyncio.get_event_loop()
+        async with self.semaphore(path):
+            return await loop.run_in_executor(self.executor, func, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def run(coroutine):
+    """Run a coroutine on a new event loop (like `asyncio.run`, for python 3.6)"""
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+class LoopThread(object):
+    """An event loop running in a background thread
+
+    Lets synchronous code (e.g. a pipeline of generators) hand coroutines to the
+    loop with `submit`.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self._run, name="kamaji-asyncio", daemon=True
+        )
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine):
+        """Schedule a coroutine
+
+        Returns: concurrent.futures.Future of its result
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def close(self):
+        """Stop the loop, after the callbacks already scheduled"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
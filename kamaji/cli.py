@@ -0,0 +1,71 @@
+"""Command line options shared by the kamaji subcommands"""
+
+import click
+
+from . import stats as stats_
+
+
+def stats_options(*decls):
+    """Add --stats, --stats-json and --profile options to a command
+
+    The command receives them as its `stats`, `stats_json` and `profile` arguments,
+    to pass to `collect_stats`.
+
+    Args:
+    - decls: names of the --stats option (default: "--stats")
+    """
+    decls = decls or ("--stats",)
+
+    def decorator(func):
+        # options are listed in the reverse order of decoration
+        func = click.option(
+            "--profile",
+            help="Profile with cProfile, writing the stats to this file "
+            "(see python -m pstats)",
+            type=click.Path(dir_okay=False, writable=True),
+        )(func)
+        func = click.option(
+            "--stats-json",
+            help="Write the statistics to this JSON file",
+            type=click.Path(dir_okay=False, writable=True),
+        )(func)
+        func = click.option(
+            *decls,
+            "stats",
+            is_flag=True,
+            default=False,
+            help="Report time spent in each stage, call counts and bytes read",
+        )(func)
+        return func
+
+    return decorator
+
+
+def collect_stats(stats, stats_json, profile):
+    """Collect statistics until the current command finishes
+
+    The summary is printed (with `stats`) or written to `stats_json`, and the
+    cProfile dump to `profile`, when the click context is closed.
+    """
+    ctx = click.get_current_context()
+    if stats or stats_json:
+        stats_.enable()
+    if profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def dump():
+            profiler.disable()
+            profiler.dump_stats(profile)
+
+        ctx.call_on_close(dump)
+
+    def report():
+        if stats:
+            stats_.report()
+        if stats_json:
+            stats_.write_json(stats_json)
+
+    ctx.call_on_close(report)
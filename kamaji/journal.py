@@ -0,0 +1,175 @@
+"""Append-only journal of file operations
+
+Records each operation before it is performed ("plan") and after it succeeded
+("done"), one JSON object per line. The file is fsync'ed in batches, so at most the
+last few completed operations are lost in a crash.
+
+A journal allows an interrupted run to be resumed, skipping completed operations
+without checking the file system, and a run to be rolled back by undoing completed
+operations in reverse order.
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Iterator, Set, Tuple
+
+# Operations
+MOVE = "mv"
+DELETE = "rm"
+LINK = "ln"
+CLONE = "clone"
+
+Key = Tuple[str, str, str]
+
+
+class Journal(object):
+    """Journal of planned and completed operations
+
+    Each operation is identified by a (op, src, dst) key, with dst "" for
+    operations taking a single path. Instances are thread safe.
+    """
+
+    def __init__(self, path: str, resume=False, sync_every=100, sync_interval=1.0):
+        """Open a journal
+
+        Args:
+        - path: journal file
+        - resume: skip the operations completed according to existing entries.
+          Either way, new entries are appended, so earlier runs can still be
+          rolled back.
+        - sync_every: fsync after this many records
+        - sync_interval: fsync after this many seconds
+        """
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+        self.completed: Set[Key] = set()
+        if resume and os.path.exists(path):
+            for record in self.records(path):
+                key = (record["op"], record["src"], record["dst"])
+                if record["state"] == "done":
+                    self.completed.add(key)
+                elif record["state"] == "undone":
+                    self.completed.discard(key)
+            logging.info("Journal lists %d completed operations", len(self.completed))
+        self.file = open(path, "a", encoding="utf-8")
+        self.pending = 0
+        self.synced = time.monotonic()
+
+    @staticmethod
+    def records(path: str) -> Iterator[dict]:
+        """Read the records of a journal file, ignoring a truncated last line"""
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logging.warning("Ignoring corrupt journal entry: %r", line)
+
+    def is_done(self, op: str, src: str, dst: str = "") -> bool:
+        """Whether an operation was completed in a previous run"""
+        return (op, src, dst) in self.completed
+
+    def plan(self, op: str, src: str, dst: str = ""):
+        """Record that an operation is about to be performed"""
+        self._write(op, src, dst, "plan")
+
+    def done(self, op: str, src: str, dst: str = ""):
+        """Record that an operation succeeded"""
+        with self.lock:
+            self.completed.add((op, src, dst))
+        self._write(op, src, dst, "done")
+
+    def undo(self, op: str, src: str, dst: str = ""):
+        """Record that a completed operation was reverted"""
+        with self.lock:
+            self.completed.discard((op, src, dst))
+        self._write(op, src, dst, "undone")
+
+    def _write(self, op, src, dst, state):
+        line = json.dumps({"state": state, "op": op, "src": src, "dst": dst})
+        with self.lock:
+            self.file.write(line + "\n")
+            self.pending += 1
+            if (
+                self.pending >= self.sync_every
+                or time.monotonic() - self.synced >= self.sync_interval
+            ):
+                self._sync()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.synced = time.monotonic()
+
+    def sync(self):
+        """Write all records to disk"""
+        with self.lock:
+            self._sync()
+
+    def close(self):
+        with self.lock:
+            self._sync()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def rollback(self, dry_run=False):
+        """Undo completed operations, most recent first
+
+        Moved files are moved back. Deleted files can't be restored and are
+        reported. Files replaced by links still have their content, so links are
+        left in place.
+
+        Returns: number of operations undone
+        """
+        self.sync()
+        done = []
+        undone = set()
+        for record in self.records(self.path):
+            key = (record["op"], record["src"], record["dst"])
+            if record["state"] == "done":
+                done.append(key)
+                undone.discard(key)
+            elif record["state"] == "undone":
+                undone.add(key)
+        count = 0
+        for key in reversed(done):
+            if key in undone:
+                continue
+            undone.add(key)
+            op, src, dst = key
+            if op == MOVE:
+                if dry_run:
+                    print('mv "{}" "{}"'.format(dst, src))
+                    continue
+                if os.path.lexists(src):
+                    logging.error("Unable to undo move: %s exists", src)
+                    continue
+                try:
+                    os.makedirs(os.path.dirname(src) or ".", exist_ok=True)
+                    shutil.move(dst, src)
+                except OSError as e:
+                    logging.error("Unable to undo move: %s", e)
+                    continue
+                logging.info('mv "{}" "{}"'.format(dst, src))
+            elif op in (LINK, CLONE):
+                logging.info("Not undoing %s %s (content unchanged)", op, src)
+                continue
+            else:
+                logging.warning("Unable to undo %s %s", op, src)
+                continue
+            self.undo(op, src, dst)
+            count += 1
+        self.sync()
+        return count
@@ -1,4 +1,16 @@
 __version__ = "0.1.0-dev0"
-from .sort import PhotoSorter
+import sys
 
 __all__ = ["PhotoSorter"]
+
+if sys.version_info < (3, 7):
+    from .sort import PhotoSorter
+else:
+
+    def __getattr__(name):
+        # imported on first use, so `kamaji sort --help` doesn't load asyncio
+        if name == "PhotoSorter":
+            from .sort import PhotoSorter
+
+            return PhotoSorter
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
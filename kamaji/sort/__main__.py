@@ -1,12 +1,16 @@
 import click
 import logging
-from .sort import PhotoSorter
+import os
+from .cache import MetadataCache
+from .plan import read_plan, write_plan
+from ..cli import collect_stats, stats_options
 
 
 @click.command()
 @click.argument(
     "src",
     # help="Source directory for images",
+    required=False,
     type=click.Path(exists=True, file_okay=False),
 )
 @click.argument(
@@ -29,16 +33,189 @@ from .sort import PhotoSorter
     default=False,
     help="Do not actually perform file moves",
 )
+@click.option(
+    "-o",
+    "--out",
+    type=click.File("w"),
+    help="Write the planned moves to a TSV file for review, instead of moving files",
+)
+@click.option(
+    "-t",
+    "--tsv",
+    type=click.File("r"),
+    help="Move files as listed in a plan written by --out, without reading their "
+    "dates again. SRC and DST are not needed.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of files to look up concurrently",
+)
+@click.option(
+    "--async-io",
+    is_flag=True,
+    default=False,
+    help="Keep many stats, reads and moves in flight at once with asyncio, which "
+    "helps on network file systems. Not used with --tsv.",
+)
+@click.option(
+    "--mount-limit",
+    multiple=True,
+    metavar="[MOUNT=]N",
+    help="With --async-io, the number of operations in flight on each mount, or "
+    "on a given mount point. May be repeated.",
+)
+@click.option(
+    "--native/--no-native",
+    default=True,
+    help="Read JPEG, PNG and CR2 metadata in-process rather than with exiftool",
+)
+@click.option(
+    "-c",
+    "--cache",
+    is_flag=True,
+    default=False,
+    help="Cache dates in {} in the destination directory, so unchanged files "
+    "are not read again on later runs".format(MetadataCache.filename),
+)
+@click.option(
+    "--cache-max-age",
+    type=click.FloatRange(min=0),
+    default=90,
+    show_default=True,
+    help="Evict cache entries unused for this many days",
+)
+@click.option(
+    "--cache-max-entries",
+    type=click.IntRange(min=0),
+    default=1000000,
+    show_default=True,
+    help="Maximum number of cache entries",
+)
+@click.option(
+    "--journal",
+    help="Record file operations in this journal, to resume or roll back the run",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="Skip operations the journal lists as completed",
+)
+@stats_options("-s", "--stats")
 @click.option("-v", "--verbose", is_flag=True, help="Verbose logging")
 @click.help_option("-h", "--help")
-def main(src, dst, recursive, dry_run, verbose):
-    "Sort images by year and month"
+def main(
+    src,
+    dst,
+    recursive,
+    dry_run,
+    out,
+    tsv,
+    jobs,
+    async_io,
+    mount_limit,
+    native,
+    cache,
+    cache_max_age,
+    cache_max_entries,
+    journal,
+    resume,
+    stats,
+    stats_json,
+    profile,
+    verbose,
+):
+    """Sort images by year and month
+
+    Sorting can be split in two: first write a plan with --out, then check it and
+    carry it out with --tsv.
+    """
 
     log_level = logging.DEBUG if verbose else logging.WARN
     logging.basicConfig(level=log_level)  # , format="%(message)s")
+    collect_stats(stats, stats_json, profile)
+
+    if tsv is None and src is None:
+        raise click.UsageError("Missing argument SRC (or --tsv)")
+    if tsv is not None and out is not None:
+        raise click.UsageError("--out and --tsv can't be combined")
+
+    if async_io or mount_limit:
+        # asyncio is only imported when used, for fast startup
+        from .. import aio
+
+        try:
+            limit, limits = aio.parse_limits(mount_limit)
+        except ValueError as ex:
+            raise click.BadParameter(str(ex), param_hint="--mount-limit")
+
+    metadatacache = None
+    if cache and tsv is None:
+        if not dry_run:
+            os.makedirs(dst, exist_ok=True)
+        if os.path.isdir(dst):
+            metadatacache = MetadataCache(
+                os.path.join(dst, MetadataCache.filename),
+                max_age=cache_max_age * 86400,
+                max_entries=cache_max_entries,
+            )
+        else:
+            logging.warning("Not caching dates: %s does not exist", dst)
+
+    if resume and not journal:
+        raise click.UsageError("--resume requires --journal")
+    movejournal = None
+    if journal and not dry_run:
+        from ..journal import Journal
+
+        movejournal = Journal(journal, resume=resume)
+
+    from .sort import PhotoSorter
+
+    sorter = PhotoSorter(
+        recursive=recursive,
+        dry_run=dry_run,
+        native=native,
+        jobs=jobs,
+        cache=metadatacache,
+        journal=movejournal,
+    )
+    try:
+        if tsv is not None:
+            sorter.apply(read_plan(tsv))
+        elif out is not None:
+            write_plan(out, sorter.plan(src, dst))
+        elif async_io:
+            fs = aio.AsyncFS(limit, limits)
+            try:
+                aio.run(sorter.sortphotos_async(src, dst, fs))
+            finally:
+                fs.close()
+        else:
+            sorter.sortphotos(src, dst)
+    finally:
+        if movejournal is not None:
+            movejournal.close()
+        if metadatacache is not None:
+            metadatacache.close()
+            click.echo(
+                "Cache: {} hits, {} misses".format(
+                    metadatacache.hits, metadatacache.misses
+                ),
+                err=True,
+            )
 
-    sorter = PhotoSorter(recursive=recursive, dry_run=dry_run)
-    sorter.sortphotos(src, dst)
+    if stats:
+        click.echo(
+            "Processed {} files in {:.1f}s ({:.1f} files/s)".format(
+                sorter.nfiles, sorter.elapsed, sorter.rate()
+            ),
+            err=True,
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+"""Persistent cache of photo dates
+
+Stores the (year, month) sets found by `PhotoSorter.getdates` in a SQLite database,
+so that files left unsorted by a previous run are not read again.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Optional, Set, Tuple
+
+from .. import stats
+
+
+class MetadataCache:
+    """SQLite cache of photo dates, keyed by file identity
+
+    Entries are keyed by absolute path and are only valid while the file's size,
+    modification time and inode are unchanged. Entries which have not been used for
+    `max_age` seconds are evicted on `close`, as are the least recently used entries
+    beyond `max_entries`.
+
+    Instances are thread safe.
+    """
+
+    # default file name, relative to the destination directory
+    filename = ".kamaji-cache.sqlite"
+
+    def __init__(
+        self, path: str, max_age: float = 90 * 86400, max_entries: int = 1000000
+    ):
+        """Open or create a cache
+
+        Args:
+        - path: SQLite database file
+        - max_age: seconds after which unused entries are evicted
+        - max_entries: maximum number of entries to keep
+        """
+        self.path = path
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # imported here, so that `kamaji sort --help` doesn't load sqlite3
+        import sqlite3
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS dates (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime INTEGER,
+                inode INTEGER,
+                dates TEXT,
+                used REAL
+            )"""
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS dates_used ON dates (used)")
+
+    def get(self, path: str, st: os.stat_result) -> Optional[Set[Tuple[str, str]]]:
+        """Look up the dates for a file
+
+        Args:
+        - path: file name
+        - st: current stat of the file
+
+        Returns:
+        - A set of (year, month) tuples, or None if the file is not cached or has
+          changed
+        """
+        path = os.path.abspath(path)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT size, mtime, inode, dates FROM dates WHERE path = ?", (path,)
+            ).fetchone()
+            if row is None or tuple(row[:3]) != (st.st_size, st.st_mtime_ns, st.st_ino):
+                self.misses += 1
+                stats.count("cache.misses")
+                return None
+            self.hits += 1
+            stats.count("cache.hits")
+            self.db.execute(
+                "UPDATE dates SET used = ? WHERE path = ?", (time.time(), path)
+            )
+        return set(tuple(date.split(":")) for date in row[3].split(",") if date)
+
+    def put(self, path: str, st: os.stat_result, dates: Set[Tuple[str, str]]):
+        """Store the dates for a file
+
+        Args:
+        - path: file name
+        - st: stat of the file when the dates were read
+        - dates: set of (year, month) tuples
+        """
+        value = ",".join(sorted(":".join(date) for date in dates))
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO dates VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    os.path.abspath(path),
+                    st.st_size,
+                    st.st_mtime_ns,
+                    st.st_ino,
+                    value,
+                    time.time(),
+                ),
+            )
+
+    def flush(self):
+        """Commit pending changes"""
+        with self.lock:
+            self.db.commit()
+
+    def evict(self):
+        """Remove entries exceeding the age or size limits
+
+        Returns: number of entries removed
+        """
+        with self.lock:
+            removed = self.db.execute(
+                "DELETE FROM dates WHERE used < ?", (time.time() - self.max_age,)
+            ).rowcount
+            removed += self.db.execute(
+                """DELETE FROM dates WHERE path IN (
+                    SELECT path FROM dates ORDER BY used DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            ).rowcount
+            self.db.commit()
+        if removed:
+            logging.debug("Evicted %d entries from %s", removed, self.path)
+        return removed
+
+    def close(self):
+        """Evict old entries and close the database"""
+        self.evict()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
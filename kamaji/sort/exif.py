@@ -0,0 +1,182 @@
+"""In-process reader for EXIF and XMP dates
+
+Reads `CreateDate` and `DateTimeOriginal` from JPEG, PNG and TIFF-based raw files
+(e.g. CR2) without starting exiftool. Files are memory mapped and only the metadata
+segments are touched, so the image data itself is never read.
+
+`read_dates` returns None for anything it does not understand, including files
+without any of the date tags; callers should fall back to exiftool in that case.
+"""
+
+import mmap
+import re
+import struct
+import zlib
+from typing import Dict, Optional, Set, Tuple
+
+from .. import stats
+
+# EXIF tag ids
+EXIF_IFD = 0x8769
+DATE_TIME_ORIGINAL = 0x9003
+CREATE_DATE = 0x9004
+
+exif_tags = {DATE_TIME_ORIGINAL: "DateTimeOriginal", CREATE_DATE: "CreateDate"}
+
+# TIFF type 2 (ASCII) values like "2019:05:01 12:00:00"
+exifdate = re.compile(rb"^([0-9]{4}):([0-9]{2})")
+# XMP attributes or elements like xmp:CreateDate="2019-05-01T12:00:00"
+xmpdate = re.compile(
+    rb"(?:xmp:(CreateDate)|exif:(DateTimeOriginal))(?:\s*=\s*[\"']|>)\s*([0-9]{4})[-:]([0-9]{2})"
+)
+
+XMP_JPEG = b"http://ns.adobe.com/xap/1.0/\x00"
+XMP_PNG = b"XML:com.adobe.xmp"
+
+
+def read_dates(path: str) -> Optional[Set[Tuple[str, str]]]:
+    """Read creation dates from an image's metadata
+
+    EXIF values take precedence over XMP values for the same tag, as in exiftool.
+
+    Args:
+    - path: image filename
+
+    Returns:
+    - A set of (year, month) tuples, or None if the file format is not supported,
+      the metadata could not be parsed or it has no date tags
+
+    Raises:
+    - OSError: the file could not be opened
+    """
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return None
+    with data:
+        stats.count("exif.bytes_mapped", len(data))
+        try:
+            tags = _read_tags(data)
+        except (struct.error, IndexError, ValueError, zlib.error):
+            return None
+    if not tags:
+        # e.g. only in maker notes, which exiftool can read
+        return None
+    return set(tags.values())
+
+
+def _read_tags(data) -> Optional[Dict[str, Tuple[str, str]]]:
+    if data[:2] == b"\xff\xd8":
+        return _read_jpeg(data)
+    elif data[:8] == b"\x89PNG\r\n\x1a\n":
+        return _read_png(data)
+    elif data[:4] in (b"II*\x00", b"MM\x00*"):
+        return _read_tiff(data, 0)
+    return None
+
+
+def _read_jpeg(data) -> Dict[str, Tuple[str, str]]:
+    exif: Dict[str, Tuple[str, str]] = {}
+    xmp: Dict[str, Tuple[str, str]] = {}
+    pos = 2
+    while True:
+        if data[pos] != 0xFF:
+            raise ValueError("Invalid JPEG marker")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # fill byte
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # no payload
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            # end of image or start of scan; metadata comes before either
+            break
+        (length,) = struct.unpack_from(">H", data, pos + 2)
+        start = pos + 4
+        if marker == 0xE1:
+            if data[start : start + 6] == b"Exif\x00\x00":
+                exif.update(_read_tiff(data[start + 6 : pos + 2 + length], 0))
+            elif data[start : start + len(XMP_JPEG)] == XMP_JPEG:
+                xmp.update(_read_xmp(data[start : pos + 2 + length]))
+        pos += 2 + length
+    xmp.update(exif)
+    return xmp
+
+
+def _read_png(data) -> Dict[str, Tuple[str, str]]:
+    exif: Dict[str, Tuple[str, str]] = {}
+    xmp: Dict[str, Tuple[str, str]] = {}
+    pos = 8
+    while pos + 8 <= len(data):
+        length, chunk = struct.unpack_from(">I4s", data, pos)
+        start = pos + 8
+        if chunk == b"eXIf":
+            exif.update(_read_tiff(data[start : start + length], 0))
+        elif chunk == b"iTXt" and data[start : start + len(XMP_PNG) + 1] == (
+            XMP_PNG + b"\x00"
+        ):
+            # keyword, null, compression flag, method, language, null, keyword, null
+            text = data[start : start + length]
+            compressed = text[len(XMP_PNG) + 1]
+            text = text[len(XMP_PNG) + 3 :]
+            text = text.split(b"\x00", 2)[2]
+            if compressed:
+                text = zlib.decompress(text)
+            xmp.update(_read_xmp(text))
+        elif chunk == b"IEND":
+            break
+        pos = start + length + 4  # skip CRC
+    xmp.update(exif)
+    return xmp
+
+
+def _read_tiff(data, base: int) -> Dict[str, Tuple[str, str]]:
+    """Read dates from a TIFF structure starting at data[base]"""
+    order = data[base : base + 2]
+    if order == b"II":
+        endian = "<"
+    elif order == b"MM":
+        endian = ">"
+    else:
+        raise ValueError("Invalid TIFF header")
+    (ifd0,) = struct.unpack_from(endian + "I", data, base + 4)
+    dates: Dict[str, Tuple[str, str]] = {}
+    for tag, typ, count, value in _read_ifd(data, base + ifd0, endian):
+        if tag == EXIF_IFD:
+            (offset,) = struct.unpack(endian + "I", value)
+            for tag, typ, count, value in _read_ifd(data, base + offset, endian):
+                if tag in exif_tags and typ == 2:
+                    if count > 4:
+                        (offset,) = struct.unpack(endian + "I", value)
+                        value = data[base + offset : base + offset + count]
+                    match = exifdate.match(value)
+                    if match:
+                        dates[exif_tags[tag]] = (
+                            match.group(1).decode(),
+                            match.group(2).decode(),
+                        )
+    return dates
+
+
+def _read_ifd(data, pos: int, endian: str):
+    """Iterate over (tag, type, count, value) for the entries of an IFD
+
+    `value` is the raw 4-byte value/offset field.
+    """
+    (n,) = struct.unpack_from(endian + "H", data, pos)
+    entry = struct.Struct(endian + "HHI4s")
+    for i in range(n):
+        yield entry.unpack_from(data, pos + 2 + 12 * i)
+
+
+def _read_xmp(packet) -> Dict[str, Tuple[str, str]]:
+    dates: Dict[str, Tuple[str, str]] = {}
+    for match in xmpdate.finditer(packet):
+        tag = (match.group(1) or match.group(2)).decode()
+        dates.setdefault(tag, (match.group(3).decode(), match.group(4).decode()))
+    return dates
@@ -0,0 +1,342 @@
+"""Long-running exiftool workers
+
+Starting exiftool (a perl script) dominates the cost of reading tags from a single
+file. `ExifTool` keeps one `exiftool -stay_open True -@ -` process alive and sends it
+one command per request, reading the output back up to the `{ready}` marker.
+`ExifToolPool` runs several of them for concurrent lookups. `AsyncExifTool` and
+`AsyncExifToolPool` do the same through asyncio subprocess pipes.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import subprocess
+import threading
+from typing import List, Optional
+
+from .. import stats
+
+EXIFTOOL = os.environ.get("EXIFTOOL", "exiftool")
+
+
+class ExifTool:
+    """A persistent exiftool process
+
+    Commands are written to exiftool's stdin one argument per line, terminated by
+    `-execute`. If the worker dies it is restarted once; if that fails too the
+    command is run in a one-off exiftool process instead, as are all later commands.
+
+    Instances are thread safe but process a single command at a time.
+    """
+
+    ready = "{ready}"
+
+    def __init__(self, executable: str = EXIFTOOL):
+        """Create a new worker. The process is started lazily.
+
+        Args:
+        - executable: exiftool command
+        """
+        self.executable = executable
+        self.process: Optional[subprocess.Popen] = None
+        self.lock = threading.Lock()
+        # set once the worker can't be (re)started; use one-off processes after that
+        self.failed = False
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Start the exiftool process"""
+        self.process = subprocess.Popen(
+            [self.executable, "-stay_open", "True", "-@", "-"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+            encoding="utf-8",
+            errors="surrogateescape",
+        )
+        stats.count("exiftool.processes")
+        logging.debug("Started exiftool worker (pid %d)", self.process.pid)
+
+    def close(self):
+        """Ask the exiftool process to exit and wait for it"""
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            if process.poll() is None:
+                process.stdin.write("-stay_open\nFalse\n")
+                process.stdin.flush()
+            process.stdin.close()
+            process.wait(timeout=10)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+        finally:
+            process.stdout.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def _communicate(self, args: List[str]) -> str:
+        if not self.running:
+            self.start()
+        process = self.process
+        process.stdin.write("\n".join(args) + "\n-execute\n")
+        process.stdin.flush()
+        output = []
+        for line in process.stdout:
+            if line.rstrip() == self.ready:
+                output = "".join(output)
+                stats.count("exiftool.bytes_read", len(output))
+                return output
+            output.append(line)
+        raise BrokenPipeError("exiftool exited with status %s" % process.wait())
+
+    def execute(self, *args: str) -> str:
+        """Run exiftool with the given arguments
+
+        A file which can't be read doesn't raise an error, as the worker just
+        carries on: its output is missing, or with `-json` has an "Error" field.
+
+        Args:
+        - args: command line arguments for exiftool (including file names)
+
+        Returns:
+        - exiftool output
+
+        Raises:
+        - CalledProcessError: exiftool failed, which is only detected when it runs
+          in a one-off process (see `execute_once`)
+        - OSError: exiftool could not be started
+        """
+        args = list(args)
+        if any("\n" in arg for arg in args):
+            # can't be expressed in the -@ argument file
+            return self.execute_once(*args)
+        with self.lock, stats.timer("exiftool"):
+            for attempt in range(0 if self.failed else 2):
+                try:
+                    return self._communicate(args)
+                except (OSError, ValueError) as e:
+                    logging.warning("exiftool worker failed: %s", e)
+                    self.close()
+            self.failed = True
+        return self.execute_once(*args)
+
+    def execute_once(self, *args: str) -> str:
+        """Run exiftool in a new process
+
+        Raises:
+        - CalledProcessError: exiftool exited with an error, e.g. if any file could
+          not be read. The output is in its `output` attribute.
+        """
+        stats.count("exiftool.processes")
+        with stats.timer("exiftool"):
+            output = subprocess.check_output(
+                [self.executable] + list(args),
+                universal_newlines=True,
+                encoding="utf-8",
+                errors="surrogateescape",
+            )
+        stats.count("exiftool.bytes_read", len(output))
+        return output
+
+
+class ExifToolPool:
+    """A fixed number of `ExifTool` workers
+
+    Each command is sent to an idle worker, so up to `size` commands run at once.
+    """
+
+    def __init__(self, executable: str = EXIFTOOL, size: int = 1):
+        """Create a pool of workers. Processes are started lazily.
+
+        Args:
+        - executable: exiftool command
+        - size: number of exiftool processes
+        """
+        self.workers = [ExifTool(executable) for i in range(size)]
+        self.idle: "queue.Queue[ExifTool]" = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+
+    def close(self):
+        """Stop all worker processes"""
+        for worker in self.workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, *args: str) -> str:
+        """Run exiftool with the given arguments on the next idle worker
+
+        See `ExifTool.execute`.
+        """
+        worker = self.idle.get()
+        try:
+            return worker.execute(*args)
+        finally:
+            self.idle.put(worker)
+
+
+class AsyncExifTool:
+    """A persistent exiftool process driven through asyncio pipes
+
+    Works like `ExifTool`, but waiting for output doesn't block the event loop. If
+    the worker dies it is restarted once; after that, commands run in one-off
+    processes. Processes one command at a time.
+    """
+
+    ready = ExifTool.ready
+
+    def __init__(self, executable: str = EXIFTOOL):
+        """Create a new worker. The process is started lazily, on the event loop.
+
+        Args:
+        - executable: exiftool command
+        """
+        self.executable = executable
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.lock: Optional[asyncio.Lock] = None
+        self.failed = False
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        """Start the exiftool process"""
+        self.process = await asyncio.create_subprocess_exec(
+            self.executable,
+            "-stay_open",
+            "True",
+            "-@",
+            "-",
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        stats.count("exiftool.processes")
+        logging.debug("Started exiftool worker (pid %d)", self.process.pid)
+
+    async def close(self):
+        """Ask the exiftool process to exit and wait for it"""
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            if process.returncode is None:
+                process.stdin.write(b"-stay_open\nFalse\n")
+                await process.stdin.drain()
+            process.stdin.close()
+            await asyncio.wait_for(process.wait(), 10)
+        except (OSError, asyncio.TimeoutError):
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+
+    async def _communicate(self, args: List[str]) -> str:
+        if not self.running:
+            await self.start()
+        process = self.process
+        process.stdin.write(
+            ("\n".join(args) + "\n-execute\n").encode("utf-8", "surrogateescape")
+        )
+        await process.stdin.drain()
+        output = []
+        while True:
+            line = (await process.stdout.readline()).decode("utf-8", "surrogateescape")
+            if not line:
+                raise BrokenPipeError(
+                    "exiftool exited with status %s" % await process.wait()
+                )
+            if line.rstrip() == self.ready:
+                output = "".join(output)
+                stats.count("exiftool.bytes_read", len(output))
+                return output
+            output.append(line)
+
+    async def execute(self, *args: str) -> str:
+        """Run exiftool with the given arguments
+
+        As for `ExifTool.execute`, only one-off processes raise CalledProcessError.
+        """
+        args = list(args)
+        if any("\n" in arg for arg in args):
+            return await self.execute_once(*args)
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        # no stats.timer: timers can't span awaits, which interleave on one thread
+        async with self.lock:
+            for attempt in range(0 if self.failed else 2):
+                try:
+                    return await self._communicate(args)
+                except (OSError, ValueError) as e:
+                    logging.warning("exiftool worker failed: %s", e)
+                    await self.close()
+            self.failed = True
+        return await self.execute_once(*args)
+
+    async def execute_once(self, *args: str) -> str:
+        """Run exiftool in a new process
+
+        Raises:
+        - CalledProcessError: exiftool exited with an error, e.g. if any file could
+          not be read. The output is in its `output` attribute.
+        """
+        stats.count("exiftool.processes")
+        process = await asyncio.create_subprocess_exec(
+            self.executable, *args, stdout=subprocess.PIPE
+        )
+        stdout, _ = await process.communicate()
+        output = stdout.decode("utf-8", "surrogateescape")
+        stats.count("exiftool.bytes_read", len(output))
+        if process.returncode:
+            raise subprocess.CalledProcessError(
+                process.returncode, [self.executable] + list(args), output
+            )
+        return output
+
+
+class AsyncExifToolPool:
+    """A fixed number of `AsyncExifTool` workers
+
+    Each command is sent to an idle worker, so up to `size` commands run at once.
+    """
+
+    def __init__(self, executable: str = EXIFTOOL, size: int = 1):
+        self.workers = [AsyncExifTool(executable) for i in range(size)]
+        self.idle: Optional[asyncio.Queue] = None
+
+    async def close(self):
+        """Stop all worker processes"""
+        for worker in self.workers:
+            await worker.close()
+
+    async def execute(self, *args: str) -> str:
+        """Run exiftool with the given arguments on the next idle worker
+
+        See `ExifTool.execute`.
+        """
+        if self.idle is None:
+            self.idle = asyncio.Queue()
+            for worker in self.workers:
+                self.idle.put_nowait(worker)
+        worker = await self.idle.get()
+        try:
+            return await worker.execute(*args)
+        finally:
+            self.idle.put_nowait(worker)
@@ -0,0 +1,176 @@
+"""Moving files without overwriting existing ones
+
+`rename_noreplace` checks for an existing destination and renames in one atomic
+step, so `Mover` never needs to stat the destination first. Files are only copied
+when moving across devices, using `copy_file_range` or `sendfile` where available.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import shutil
+import threading
+from typing import Set
+
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1
+
+
+def _load_renameat2():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        renameat2 = libc.renameat2
+    except (OSError, AttributeError, TypeError):
+        return None
+    renameat2.argtypes = [
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_uint,
+    ]
+    renameat2.restype = ctypes.c_int
+    return renameat2
+
+
+_renameat2 = _load_renameat2()
+
+
+def rename_noreplace(src: str, dst: str):
+    """Atomically rename src to dst unless dst exists
+
+    Uses renameat2(RENAME_NOREPLACE) if available. Otherwise a hard link is created
+    and the source unlinked, which is also atomic with respect to dst. Filesystems
+    supporting neither fall back to a check followed by `os.rename`.
+
+    Raises:
+    - FileExistsError: dst exists
+    - OSError: other errors, e.g. EXDEV if src and dst are on different devices
+    """
+    global _renameat2
+    if _renameat2 is not None:
+        result = _renameat2(
+            AT_FDCWD, os.fsencode(src), AT_FDCWD, os.fsencode(dst), RENAME_NOREPLACE
+        )
+        if result == 0:
+            return
+        err = ctypes.get_errno()
+        if err not in (errno.ENOSYS, errno.EINVAL):
+            raise OSError(err, os.strerror(err), src, None, dst)
+        if err == errno.ENOSYS:
+            # not supported by the kernel
+            _renameat2 = None
+    try:
+        os.link(src, dst, follow_symlinks=False)
+    except OSError as e:
+        if e.errno not in (errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EMLINK):
+            raise
+        # no hard links on this filesystem
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+        os.rename(src, dst)
+    else:
+        os.unlink(src)
+
+
+def copyfile_noreplace(src: str, dst: str):
+    """Copy a file's contents and metadata, unless dst exists
+
+    Raises:
+    - FileExistsError: dst exists
+    """
+    with open(src, "rb") as fsrc:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            with open(fd, "wb") as fdst:
+                _copy_range(fsrc, fdst, os.fstat(fsrc.fileno()).st_size)
+            shutil.copystat(src, dst)
+        except BaseException:
+            os.unlink(dst)
+            raise
+
+
+def _copy_range(fsrc, fdst, size: int):
+    """Copy size bytes in the kernel if possible"""
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    for func in ("copy_file_range", "sendfile"):
+        copy = getattr(os, func, None)
+        if copy is None:
+            continue
+        copied = 0
+        try:
+            while copied < size:
+                if func == "sendfile":
+                    n = copy(outfd, infd, copied, size - copied)
+                else:
+                    n = copy(infd, outfd, size - copied, copied, copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError as e:
+            if copied or e.errno not in (
+                errno.EXDEV,
+                errno.ENOSYS,
+                errno.EINVAL,
+                errno.EOPNOTSUPP,
+                errno.EBADF,
+            ):
+                raise
+            continue
+        if copied == size:
+            return
+        # file changed size; copy the remainder in user space
+        fsrc.seek(copied)
+        fdst.seek(copied)
+        break
+    shutil.copyfileobj(fsrc, fdst, 1 << 20)
+
+
+class Mover(object):
+    """Moves files without overwriting, creating destination directories as needed
+
+    Directories created (or found to exist) are remembered, so each is only
+    checked once. Instances are thread safe.
+    """
+
+    def __init__(self):
+        self.dirs: Set[str] = set()
+        self.lock = threading.Lock()
+
+    def makedirs(self, path: str):
+        """Create a directory and its parents unless known to exist"""
+        if path in self.dirs:
+            return
+        os.makedirs(path, exist_ok=True)
+        with self.lock:
+            self.dirs.add(path)
+
+    def move(self, src: str, dst: str):
+        """Move src to dst
+
+        Renames within a device; copies and deletes across devices.
+
+        Raises:
+        - FileExistsError: dst exists
+        """
+        parent = os.path.dirname(dst)
+        if parent:
+            self.makedirs(parent)
+        try:
+            rename_noreplace(src, dst)
+        except FileNotFoundError:
+            if not parent or not os.path.exists(src) or os.path.isdir(parent):
+                raise
+            # directory was removed since it was created
+            with self.lock:
+                self.dirs.discard(parent)
+            self.makedirs(parent)
+            rename_noreplace(src, dst)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            logging.debug("Copying %s across devices", src)
+            copyfile_noreplace(src, dst)
+            os.unlink(src)
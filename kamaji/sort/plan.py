@@ -0,0 +1,69 @@
+"""Plans of moves, for reviewing a sort before running it
+
+A plan lists the moves `PhotoSorter.plan` decided on, in the format of the uniq TSV
+action files: one `R<tab>src<tab>dst` line per file, with groups of files which are
+moved together (e.g. a JPG and its RAW file) separated by blank lines. Lines
+starting with `#` are ignored. Changing the line of any file in a group to `K`
+leaves the whole group in place, so files moved together are never split up.
+"""
+
+import logging
+from typing import Iterable, Iterator, List, TextIO, Tuple
+
+Move = Tuple[str, str]
+
+header = """# Actions:
+# R\tsrc\tdst\tMove the file to `dst`
+# K\tsrc\t\tKeep the file, and the rest of its group, where it is
+# Groups of files separated by blank lines are moved together.
+"""
+
+
+def write_plan(outfile: TextIO, groups: Iterable[List[Move]]):
+    """Write groups of moves as they are produced
+
+    Args:
+    - outfile: output file
+    - groups: lists of (src, dst) moves
+    """
+    outfile.write(header)
+    for group in groups:
+        outfile.write(
+            "\n" + "".join("R\t{}\t{}\n".format(src, dst) for src, dst in group)
+        )
+
+
+def read_plan(infile: TextIO) -> Iterator[List[Move]]:
+    """Read groups of moves from a plan
+
+    Groups containing a `K` line are skipped entirely, as are groups with lines
+    which can't be parsed. Parse errors are logged.
+
+    Args:
+    - infile: plan file, opened in text mode
+
+    Yields: lists of (src, dst) moves
+    """
+    group: List[Move] = []
+    keep = False
+    for linenum, line in enumerate(infile):
+        line = line.rstrip("\n")
+        if not line:
+            if group and not keep:
+                yield group
+            group = []
+            keep = False
+            continue
+        if line.startswith("#"):
+            continue
+        fields = line.split("\t")
+        if fields[0] == "R" and len(fields) == 3:
+            group.append((fields[1], fields[2]))
+        elif fields[0] == "K" and len(fields) in (2, 3):
+            keep = True
+        else:
+            # don't move the rest of the group without this file
+            logging.error("Parse error line %d: %r", linenum, line)
+            keep = True
+    if group and not keep:
+        yield group
@@ -4,17 +4,33 @@
 # identify -verbose IMG_4573.JPG grep 'exif:DateTime'
 # exiftool IMG_4573.JPG |grep -i date|sed -r 's/^[^:]*: ([0-9]{4}):([0-9][0-9]?):.*$/\1 \2/'|uniq
 
+import asyncio
 import subprocess, re, sys
 import os, os.path
 from os.path import join
-import shutil
 import logging
-import fnmatch, re
-from typing import Iterable, Tuple, List, Dict, Set
+import time
+import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import ExitStack
+from typing import Deque, Iterable, Iterator, Tuple, List, Dict, Set, Optional
+
+from .exiftool import EXIFTOOL, AsyncExifToolPool, ExifToolPool
+from .cache import MetadataCache
+from .move import Mover
+from ..aio import AsyncFS
+from ..journal import Journal, MOVE
+from .. import stats
+from . import exif
+from .walk import walk
 
 photo_ext = set((".jpg", ".jpeg", ".gif", ".cr2", ".png"))
 
-EXIFTOOL = os.environ.get("EXIFTOOL", "exiftool")
+# Tags read by PhotoSorter.getdates
+date_tags = ("CreateDate", "DateTimeOriginal")
+dateval = re.compile("^([0-9]{4}):([0-9][0-9]?)")
 
 
 class PhotoSorter:
@@ -25,7 +41,16 @@ class PhotoSorter:
 
     """
 
-    def __init__(self, dry_run=False, recursive=True, blacklist=[".*"]):
+    def __init__(
+        self,
+        dry_run=False,
+        recursive=True,
+        blacklist=[".*"],
+        native=True,
+        jobs=1,
+        cache: Optional[MetadataCache] = None,
+        journal: Optional[Journal] = None,
+    ):
         """Create a new PhotoSorter
 
         Args:
@@ -33,10 +58,33 @@ class PhotoSorter:
         - recursive: descend into subdirectories
         - blacklist: a list of file globs to ignore. Defaults to ".*" to ignore
           hidden files
+        - native: read dates from JPEG, PNG and TIFF/CR2 files in-process, only
+          using exiftool for other formats
+        - jobs: number of threads (and exiftool processes) used to look up dates.
+          Moves into each destination directory are still performed one at a time.
+        - cache: a MetadataCache used to avoid re-reading unchanged files
+        - journal: a Journal recording moves. Moves it lists as completed are
+          skipped.
         """
         self.dry_run = dry_run
         self.recursive = recursive
         self.blacklist = blacklist
+        self.native = native
+        self.jobs = jobs
+        self.cache = cache
+        self.journal = journal
+        self.exiftool = ExifToolPool(EXIFTOOL, jobs)
+        self.batch_size = 256
+        self.lock = threading.Lock()
+        self.dirlocks: Dict[str, threading.Lock] = {}
+        self.mover = Mover()
+        # statistics
+        self.nfiles = 0
+        self.elapsed = 0.0
+
+    def rate(self) -> float:
+        """Number of files processed per second by `sortphotos`, `plan` or `apply`"""
+        return self.nfiles / self.elapsed if self.elapsed > 0 else 0.0
 
     def getEXIF(self, img: str) -> Iterable[Tuple[str, str]]:
         """Get the creation date for an image from EXIF tags
@@ -49,13 +97,14 @@ class PhotoSorter:
         - img: image filename
 
         Returns:
-        - A list of (year, month) tuples
-
-        Raises:
-        - CalledProcessError: error running exiftool
+        - A list of (year, month) tuples, empty if exiftool could not read the file
         """
-        cmd = [EXIFTOOL, img]
-        output = subprocess.check_output(cmd, universal_newlines=True)
+        try:
+            output = self.exiftool.execute(img)
+        except subprocess.CalledProcessError as e:
+            output = e.output
+        with self.lock:
+            self.nfiles += 1
         lines = output.split("\n")
         datere = re.compile("^([^:]*date[^:]*): ([0-9]{4}):([0-9][0-9]?):.*$", re.I)
         dates: Set[Tuple[str, str]] = set()
@@ -67,6 +116,130 @@ class PhotoSorter:
                         dates.add((match.group(2), match.group(3)))
         return dates
 
+    def getdates(self, imgs: Iterable[str]) -> Dict[str, Set[Tuple[str, str]]]:
+        """Get the creation dates for several images from EXIF tags
+
+        Formats supported by `exif.read_dates` are read in-process (unless `native`
+        is False). Other files require `exiftool` to be installed. Only the tags in
+        `date_tags` are requested, formatted as `YYYY:MM` in exiftool's JSON output.
+        Images are sent to exiftool in batches of `batch_size` files. If a `cache`
+        is set, unchanged files are looked up there first.
+
+        Args:
+        - imgs: image filenames
+
+        Returns:
+        - A dict mapping each image to a set of (year, month) tuples
+        """
+        dates: Dict[str, Set[Tuple[str, str]]] = {}
+        unparsed = []
+        uncached: Dict[str, os.stat_result] = {}
+        for img in imgs:
+            found, st = self._lookup(img)
+            if st is not None:
+                uncached[img] = st
+            if found is None:
+                unparsed.append(img)
+                dates[img] = set()
+            else:
+                dates[img] = found
+
+        read: Set[str] = set()
+        for i in range(0, len(unparsed), self.batch_size):
+            batch = unparsed[i : i + self.batch_size]
+            try:
+                output = self.exiftool.execute(*self._exiftool_args(batch))
+            except subprocess.CalledProcessError as e:
+                # exiftool fails if any file could not be read; keep the others
+                output = e.output
+            read |= self._parse(output, dates)
+        self._unread(unparsed, read, uncached)
+        self._store(dates, uncached)
+        return dates
+
+    def _lookup(
+        self, img: str
+    ) -> Tuple[Optional[Set[Tuple[str, str]]], Optional[os.stat_result]]:
+        """Get the dates of an image from the cache, or read them in-process
+
+        Returns:
+        - The dates, or None if exiftool is needed
+        - The stat of the file if its dates should be cached, or None
+        """
+        if self.cache is not None:
+            try:
+                st = os.stat(img)
+            except OSError:
+                pass
+            else:
+                found = self.cache.get(img, st)
+                if found is not None:
+                    return found, None
+                return self._read(img), st
+        return self._read(img), None
+
+    def _read(self, img: str) -> Optional[Set[Tuple[str, str]]]:
+        """Read dates in-process, if `native` and the format is supported"""
+        if self.native:
+            try:
+                with stats.timer("sort.exif"):
+                    return exif.read_dates(img)
+            except OSError as e:
+                logging.debug("Unable to read %s: %s", img, e)
+        return None
+
+    @staticmethod
+    def _exiftool_args(batch: List[str]) -> List[str]:
+        """exiftool arguments reading `date_tags` from some files as JSON"""
+        tags = ["-" + tag for tag in date_tags]
+        return ["-json", "-d", "%Y:%m"] + tags + ["--"] + batch
+
+    @staticmethod
+    def _parse(output: str, dates: Dict[str, Set[Tuple[str, str]]]) -> Set[str]:
+        """Add the dates in exiftool's JSON output to those of files in dates
+
+        Returns:
+        - The files exiftool read without an error
+        """
+        try:
+            records = json.loads(output) if output.strip() else []
+        except ValueError:
+            logging.error("Unable to parse exiftool output: %.200r", output)
+            return set()
+        read = set()
+        for record in records:
+            img = record.get("SourceFile")
+            if img not in dates:
+                continue
+            if "Error" in record:
+                logging.warning("exiftool: %s: %s", record["Error"], img)
+                continue
+            read.add(img)
+            for tag in date_tags:
+                match = dateval.match(str(record.get(tag, "")))
+                if match:
+                    dates[img].add((match.group(1), match.group(2)))
+        return read
+
+    @staticmethod
+    def _unread(imgs: List[str], read: Set[str], uncached: Dict[str, os.stat_result]):
+        """Don't cache the files exiftool could not read, which have no dates"""
+        for img in imgs:
+            if img not in read:
+                logging.warning("Unable to read dates from %s", img)
+                uncached.pop(img, None)
+
+    def _store(
+        self,
+        dates: Dict[str, Set[Tuple[str, str]]],
+        uncached: Dict[str, os.stat_result],
+    ):
+        """Cache newly read dates and count the files"""
+        for img, st in uncached.items():
+            self.cache.put(img, st, dates[img])
+        with self.lock:
+            self.nfiles += len(dates)
+
     def sortphotos(self, src: str, dst: str):
         """Sort Photos
 
@@ -83,32 +256,216 @@ class PhotoSorter:
         - src: source directory
         - dst: destination directory
         """
-        # get all regular files in src dir
-        for dirpath, dirnames, filenames in os.walk(src):
-            if not self.recursive:
-                # don't recurse into subdirs
-                del dirnames[:]
-            # skip blacklisted files & dirs
-            for pattern in self.blacklist:
-                for i in range(len(dirnames) - 1, -1, -1):
-                    if fnmatch.fnmatch(dirnames[i], pattern):
-                        logging.debug("Skipping blacklisted dir %s", dirnames[i])
-                        del dirnames[i]
-                for i in range(len(filenames) - 1, -1, -1):
-                    if fnmatch.fnmatch(filenames[i], pattern):
-                        logging.debug("Skipping blacklisted file %s", filenames[i])
-                        del filenames[i]
-            # skip destination dirs
-            dstyear = re.compile(join(dst, "[0-9]{4}/?"))
-            month = re.compile("[0-9]{2}")
-            if dstyear.match(dirpath):
-                for i in range(len(dirnames) - 1, -1, -1):
-                    if month.match(dirnames[i]):
-                        logging.debug(
-                            "Skipping destination %s", join(dirpath, dirnames[i])
-                        )
-                        del dirnames[i]
+        start = time.monotonic()
+        try:
+            for _ in self._imap(self._sortgroups, self._tasks(src, dst)):
+                pass
+        finally:
+            self._finish(start)
+
+    def plan(self, src: str, dst: str) -> Iterator[List[Tuple[str, str]]]:
+        """Decide where to move photos, without moving them
+
+        Dates are looked up as in `sortphotos`, using `jobs` threads. The result can
+        be written with `plan.write_plan`, reviewed, and carried out by `apply`
+        without reading any metadata again.
+
+        Args:
+        - src: source directory
+        - dst: destination directory
+
+        Yields: groups of (src, dst) moves, each to be performed together
+        """
+        start = time.monotonic()
+        try:
+            for groups in self._imap(self._plangroups, self._tasks(src, dst)):
+                yield from groups
+        finally:
+            self._finish(start)
+
+    def apply(self, groups: Iterable[List[Tuple[str, str]]]):
+        """Perform planned moves
+
+        Each group is moved as by `movephoto`, using `jobs` threads. Errors are
+        logged and leave the group's files in place.
+
+        Args:
+        - groups: groups of (src, dst) moves, e.g. from `plan.read_plan`
+        """
+        start = time.monotonic()
+        try:
+            for _ in self._imap(self._applygroup, self._count(groups)):
+                pass
+        finally:
+            self._finish(start)
+
+    def _count(self, groups: Iterable[list]) -> Iterator[tuple]:
+        """Arguments of `_applygroup` for each group, counting the files"""
+        for group in groups:
+            with self.lock:
+                self.nfiles += len(group)
+            yield (group,)
+
+    async def sortphotos_async(
+        self, src: str, dst: str, fs: AsyncFS, inflight: int = 64
+    ):
+        """Sort photos like `sortphotos`, keeping many file operations in flight
+
+        Stats, in-process reads and moves (through `movegroup`) run in the threads
+        of `fs`, within its limits for each mount. exiftool is driven through
+        asyncio pipes by `jobs` processes. Up to `inflight` parts of directories
+        are processed at once.
+
+        Args:
+        - src: source directory
+        - dst: destination directory
+        - fs: runs the blocking file operations
+        - inflight: number of parts of directories processed concurrently
+        """
+        start = time.monotonic()
+        exiftool = AsyncExifToolPool(EXIFTOOL, self.jobs)
+        loop = asyncio.get_event_loop()
+        tasks = self._tasks(src, dst)
+        running: Set[asyncio.Future] = set()
+        try:
+            while True:
+                # walking stats directories too
+                task = await loop.run_in_executor(fs.executor, next, tasks, None)
+                if task is None:
+                    break
+                if len(running) >= inflight:
+                    done, running = await asyncio.wait(
+                        running, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        future.result()
+                running.add(
+                    asyncio.ensure_future(self._sortgroups_async(fs, exiftool, *task))
+                )
+            if running:
+                for future in (await asyncio.wait(running))[0]:
+                    future.result()
+        finally:
+            for future in running:
+                future.cancel()
+            await exiftool.close()
+            self._finish(start)
+
+    async def getdates_async(
+        self, fs: AsyncFS, exiftool: AsyncExifToolPool, imgs: Iterable[str]
+    ) -> Dict[str, Set[Tuple[str, str]]]:
+        """Get the creation dates for several images, like `getdates`
 
+        Files are looked up concurrently, and batches sent to exiftool as soon as
+        a worker is idle.
+
+        Args:
+        - fs: runs the cache and in-process lookups
+        - exiftool: exiftool workers
+        - imgs: image filenames
+
+        Returns:
+        - A dict mapping each image to a set of (year, month) tuples
+        """
+        imgs = list(imgs)
+        found = await asyncio.gather(*(fs.call(img, self._lookup, img) for img in imgs))
+        dates: Dict[str, Set[Tuple[str, str]]] = {}
+        unparsed = []
+        uncached: Dict[str, os.stat_result] = {}
+        for img, (imgdates, st) in zip(imgs, found):
+            if st is not None:
+                uncached[img] = st
+            if imgdates is None:
+                unparsed.append(img)
+                dates[img] = set()
+            else:
+                dates[img] = imgdates
+
+        async def execute(batch):
+            try:
+                return await exiftool.execute(*self._exiftool_args(batch))
+            except subprocess.CalledProcessError as e:
+                # exiftool fails if any file could not be read; keep the others
+                return e.output
+
+        outputs = await asyncio.gather(
+            *(
+                execute(unparsed[i : i + self.batch_size])
+                for i in range(0, len(unparsed), self.batch_size)
+            )
+        )
+        read: Set[str] = set()
+        for output in outputs:
+            read |= self._parse(output, dates)
+        self._unread(unparsed, read, uncached)
+        self._store(dates, uncached)
+        return dates
+
+    async def _sortgroups_async(
+        self,
+        fs: AsyncFS,
+        exiftool: AsyncExifToolPool,
+        src: str,
+        dst: str,
+        dirpath: str,
+        filegroups: Dict[str, List[str]],
+    ):
+        """Look up dates and move some groups of files, like `_sortgroups`"""
+        photodates = await self.getdates_async(
+            fs, exiftool, self._photos(dirpath, filegroups)
+        )
+        await asyncio.gather(
+            *(
+                fs.call(moves[0][1], self._applygroup, moves)
+                for moves in self._planmoves(src, dst, dirpath, filegroups, photodates)
+                if moves
+            )
+        )
+
+    def _finish(self, start: float):
+        self.exiftool.close()
+        if self.cache is not None:
+            self.cache.flush()
+        if self.journal is not None:
+            self.journal.sync()
+        self.elapsed += time.monotonic() - start
+
+    def _imap(self, func, tasks: Iterable[tuple]) -> Iterator:
+        """Call func(*args) for each args in tasks, using `jobs` threads
+
+        Yields: the results, in order
+        """
+        if self.jobs == 1:
+            for args in tasks:
+                yield func(*args)
+            return
+
+        with ThreadPoolExecutor(self.jobs) as executor:
+            pending: Deque[Future] = deque()
+            for args in tasks:
+                # bound the number of queued tasks
+                if len(pending) >= 2 * self.jobs:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(func, *args))
+            while pending:
+                yield pending.popleft().result()
+
+    def _tasks(
+        self, src: str, dst: str
+    ) -> Iterator[Tuple[str, str, str, Dict[str, List[str]]]]:
+        """Arguments of `_plangroups` for parts of each directory in src"""
+        for dirpath, filegroups in self._walk(src, dst):
+            for groups in self._split(filegroups):
+                yield src, dst, dirpath, groups
+
+    def _walk(self, src: str, dst: str) -> Iterable[Tuple[str, Dict[str, List[str]]]]:
+        """Iterate over directories in src
+
+        Yields (dirpath, filegroups) tuples, where filegroups maps each base name to a
+        list of extensions.
+        """
+        dirs = walk(src, dst, self.recursive, self.blacklist)
+        for dirpath, filenames in stats.iterate("sort.walk", dirs):
             # split extensions and group by base name
             filegroups: Dict[str, List[str]] = {}
             for f in filenames:
@@ -119,34 +476,92 @@ class PhotoSorter:
             # filegroups = {base:exts for base,exts in filegroups.items() \
             #        if any([e.lower() in photo_ext for e in exts])}
 
-            # Get list of photo dates for each group
-            for base, exts in filegroups.items():
-                dates: Set[Tuple[str, str]] = set()
-                for ext in exts:
-                    if ext.lower() in photo_ext:
-                        dates.update(self.getEXIF(join(dirpath, base + ext)))
+            yield dirpath, filegroups
 
-                # move all files if we find a single date
-                if len(dates) == 1:
-                    date = dates.pop()
-                    try:
-                        self.movephoto(
-                            src,
-                            [
-                                join(os.path.relpath(dirpath, src), base + ext)
-                                for ext in exts
-                            ],
-                            dst,
-                            date,
-                        )
-                    except OSError as e:
-                        # duplicate. Log and continue
-                        logging.error(str(e))
-                else:
-                    logging.warn(
-                        "Multiple dates found for %s",
-                        ",".join(join(dirpath, base + ext) for ext in exts),
+    def _split(
+        self, filegroups: Dict[str, List[str]]
+    ) -> Iterable[Dict[str, List[str]]]:
+        """Split the groups of a directory into about `jobs` parts"""
+        items = list(filegroups.items())
+        size = min(self.batch_size, max(1, -(-len(items) // self.jobs)))
+        for i in range(0, len(items), size):
+            yield dict(items[i : i + size])
+
+    def _plangroups(
+        self, src: str, dst: str, dirpath: str, filegroups: Dict[str, List[str]]
+    ) -> List[List[Tuple[str, str]]]:
+        """Look up dates for some groups of files from a single directory
+
+        Returns: the moves for each group with a single date
+        """
+        photodates = self.getdates(self._photos(dirpath, filegroups))
+        return self._planmoves(src, dst, dirpath, filegroups, photodates)
+
+    @staticmethod
+    def _photos(dirpath: str, filegroups: Dict[str, List[str]]) -> List[str]:
+        """Paths of the photos among some groups of files"""
+        return [
+            join(dirpath, base + ext)
+            for base, exts in filegroups.items()
+            for ext in exts
+            if ext.lower() in photo_ext
+        ]
+
+    def _planmoves(
+        self,
+        src: str,
+        dst: str,
+        dirpath: str,
+        filegroups: Dict[str, List[str]],
+        photodates: Dict[str, Set[Tuple[str, str]]],
+    ) -> List[List[Tuple[str, str]]]:
+        """Moves for each group of files with a single date"""
+        planned = []
+        for base, exts in filegroups.items():
+            dates: Set[Tuple[str, str]] = set()
+            for ext in exts:
+                if ext.lower() in photo_ext:
+                    dates.update(photodates[join(dirpath, base + ext)])
+
+            # move all files if we find a single date
+            if len(dates) == 1:
+                relpath = os.path.relpath(dirpath, src)
+                planned.append(
+                    self._moves(
+                        src,
+                        [join(relpath, base + ext) for ext in exts],
+                        dst,
+                        dates.pop(),
                     )
+                )
+            else:
+                logging.warn(
+                    "Multiple dates found for %s",
+                    ",".join(join(dirpath, base + ext) for ext in exts),
+                )
+        return planned
+
+    def _sortgroups(
+        self, src: str, dst: str, dirpath: str, filegroups: Dict[str, List[str]]
+    ):
+        """Look up dates and move some groups of files from a single directory"""
+        for moves in self._plangroups(src, dst, dirpath, filegroups):
+            self._applygroup(moves)
+
+    def _applygroup(self, moves: List[Tuple[str, str]]):
+        try:
+            self.movegroup(moves)
+        except OSError as e:
+            # duplicate. Log and continue
+            logging.error(str(e))
+
+    @staticmethod
+    def _moves(
+        srcdir: str, imgs: Iterable[str], dstdir: str, date: Tuple[str, str]
+    ) -> List[Tuple[str, str]]:
+        year, month = date
+        dst = join(dstdir, year, month)
+        return [(join(srcdir, img), join(dst, img)) for img in imgs]
 
     def movephoto(
         self, srcdir: str, imgs: Iterable[str], dstdir, date: Tuple[str, str]
@@ -164,21 +579,69 @@ class PhotoSorter:
         Exceptions:
             OSError: if any of the imgs already exist at the destination
         """
-        year, month = date
-        dst = join(dstdir, year, month)
-        moves = [(join(srcdir, img), join(dst, img)) for img in imgs]
+        self.movegroup(self._moves(srcdir, imgs, dstdir, date))
+
+    def movegroup(self, moves: List[Tuple[str, str]]):
+        """Move a set of files atomically
+
+        Args:
+            moves: list of (src, dst) paths
+
+        Exceptions:
+            OSError: if any of the destinations already exist, or a move fails.
+                The files already moved are moved back, as far as possible.
+        """
+        journal = self.journal if not self.dry_run else None
+        if journal is not None:
+            # skip moves completed before resuming
+            moves = [(s, d) for s, d in moves if not journal.is_done(MOVE, s, d)]
         # Move whole group together
-        if not any(os.path.exists(dst) for src, dst in moves):
-            for src, dst in moves:
-                if not self.dry_run:
-                    if not os.path.exists(os.path.dirname(dst)):
-                        os.makedirs(os.path.dirname(dst))
-                    shutil.move(src, dst)
-                    logging.info('mv "{}" "{}"'.format(src, dst))
-                else:
+        with ExitStack() as locks:
+            for dstdir in sorted({os.path.dirname(dst) for src, dst in moves}):
+                locks.enter_context(self._dirlock(dstdir))
+            if self.dry_run:
+                if any(os.path.exists(dst) for src, dst in moves):
+                    raise OSError(
+                        "File exists: %s"
+                        % [dst for src, dst in moves if os.path.exists(dst)][0]
+                    )
+                for src, dst in moves:
                     print('mv "{}" "{}"'.format(src, dst))
-        else:
-            raise OSError(
-                "File exists: %s"
-                % [dst for src, dst in moves if os.path.exists(dst)][0]
-            )
+                return
+
+            # Destinations are not checked beforehand; moves fail atomically if
+            # they exist, and the rest of the group is moved back.
+            done: List[Tuple[str, str]] = []
+            try:
+                for src, dst in moves:
+                    if journal is not None:
+                        journal.plan(MOVE, src, dst)
+                    with stats.timer("sort.move"):
+                        self.mover.move(src, dst)
+                    done.append((src, dst))
+                    if journal is not None:
+                        journal.done(MOVE, src, dst)
+                    logging.info('mv "{}" "{}"'.format(src, dst))
+            except OSError as e:
+                failed = dst
+                for src, dst in reversed(done):
+                    try:
+                        self.mover.move(dst, src)
+                    except OSError as undo_error:
+                        # leave it moved (and done in the journal), and keep
+                        # moving the others back
+                        logging.error(
+                            'Unable to move "%s" back to "%s": %s', dst, src, undo_error
+                        )
+                        continue
+                    if journal is not None:
+                        journal.undo(MOVE, src, dst)
+                    logging.info('mv "{}" "{}"'.format(dst, src))
+                if isinstance(e, FileExistsError):
+                    raise FileExistsError("File exists: %s" % failed) from e
+                raise
+
+    def _dirlock(self, path: str) -> threading.Lock:
+        """Lock serializing moves into a destination directory"""
+        with self.lock:
+            return self.dirlocks.setdefault(path, threading.Lock())
@@ -0,0 +1,87 @@
+"""Directory walking for PhotoSorter
+
+Blacklist globs are compiled into a single regular expression, and file types come
+from the `os.DirEntry` objects returned by `os.scandir`, so walking needs no extra
+stat calls.
+"""
+
+import fnmatch
+import logging
+import os
+import re
+from os.path import join
+from typing import Iterable, Iterator, List, Optional, Pattern, Tuple
+
+from .. import stats
+
+# Names of destination month directories
+month = re.compile("[0-9]{2}")
+
+
+def compile_globs(patterns: Iterable[str]) -> Optional[Pattern]:
+    """Combine file globs into one regular expression
+
+    Returns: a pattern matching names that match any glob, or None if there are
+    no globs
+    """
+    patterns = [fnmatch.translate(p) for p in patterns]
+    if not patterns:
+        return None
+    # fnmatch ignores case where the file system does
+    flags = re.IGNORECASE if os.path.normcase("A") == "a" else 0
+    return re.compile("|".join("(?:%s)" % p for p in patterns), flags)
+
+
+def walk(
+    src: str, dst: str, recursive=True, blacklist: Iterable[str] = ()
+) -> Iterator[Tuple[str, List[str]]]:
+    """Iterate over directories in src, top-down
+
+    Blacklisted files and directories are skipped, as are month directories
+    (`dst/YYYY/MM`) of the destination. Symbolic links to directories are not
+    followed.
+
+    Args:
+    - src: root directory
+    - dst: destination directory, which may be inside src
+    - recursive: descend into subdirectories
+    - blacklist: file globs to ignore
+
+    Yields: (dirpath, filenames) tuples
+    """
+    skip = compile_globs(blacklist)
+    dstyear = re.compile(re.escape(join(dst, "")) + "[0-9]{4}")
+    stack = [src]
+    while stack:
+        dirpath = stack.pop()
+        try:
+            with os.scandir(dirpath) as it:
+                entries = list(it)
+        except OSError as e:
+            logging.warning(e)
+            continue
+        indst = dstyear.match(dirpath) is not None
+        dirnames = []
+        filenames = []
+        for entry in entries:
+            name = entry.name
+            try:
+                isdir = entry.is_dir()
+            except OSError:
+                isdir = False
+            if skip is not None and skip.match(name):
+                logging.debug(
+                    "Skipping blacklisted %s %s", "dir" if isdir else "file", name
+                )
+            elif not isdir:
+                filenames.append(name)
+            elif indst and month.match(name):
+                logging.debug("Skipping destination %s", entry.path)
+            elif recursive and not entry.is_symlink():
+                dirnames.append(entry.path)
+
+        stats.count("sort.dirs")
+        stats.count("sort.files", len(filenames))
+        yield dirpath, filenames
+
+        stack.extend(reversed(dirnames))
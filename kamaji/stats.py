@@ -0,0 +1,172 @@
+"""Per-stage timing and counters
+
+Instrumentation is disabled by default. Until `enable` is called, `timer` returns a
+shared no-op context manager, `iterate` returns its argument unchanged and `count`
+returns immediately, so instrumented code runs at essentially full speed.
+
+Timers nest: time spent in an inner timer (on the same thread) is subtracted from
+the self time of the outer one. This also holds for `iterate`, so a chain of
+generators reports how long each stage took by itself. Times are summed over
+threads, so they can exceed the wall time.
+"""
+
+import json
+import sys
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+enabled = False
+started = 0.0
+
+_lock = threading.Lock()
+_local = threading.local()
+# name -> [calls, total seconds, self seconds]
+_timers: Dict[str, List] = {}
+_counters: Dict[str, int] = {}
+
+
+def enable():
+    """Start collecting statistics"""
+    global enabled, started
+    if not enabled:
+        enabled = True
+        started = time.perf_counter()
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    """Forget all statistics collected so far"""
+    global started
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+    started = time.perf_counter()
+
+
+class _Null(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_null = _Null()
+
+
+class _Timer(object):
+    __slots__ = ("name", "start", "child")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.child = 0.0
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].child += elapsed
+        with _lock:
+            entry = _timers.get(self.name)
+            if entry is None:
+                entry = _timers[self.name] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] += elapsed - self.child
+        return False
+
+
+def timer(name: str):
+    """Context manager timing a block of code"""
+    if not enabled:
+        return _null
+    return _Timer(name)
+
+
+def count(name: str, n: int = 1):
+    """Add n to a counter"""
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def iterate(name: str, iterable: Iterable[T]) -> Iterable[T]:
+    """Time each step of an iteration, including the final one which stops it"""
+    if not enabled:
+        return iterable
+    return _iterate(name, iterable)
+
+
+def _iterate(name: str, iterable: Iterable[T]) -> Iterator[T]:
+    it = iter(iterable)
+    while True:
+        with _Timer(name):
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+
+def summary() -> dict:
+    """Statistics collected so far, as a JSON-compatible dict"""
+    with _lock:
+        return {
+            "wall": time.perf_counter() - started if enabled else 0.0,
+            "timers": {
+                name: {"calls": calls, "total": total, "self": own}
+                for name, (calls, total, own) in _timers.items()
+            },
+            "counters": dict(_counters),
+        }
+
+
+def report(file=None):
+    """Print a summary of the statistics, slowest stages first"""
+    if file is None:
+        file = sys.stderr
+    data = summary()
+    print("Wall time: {:.3f}s".format(data["wall"]), file=file)
+    if data["timers"]:
+        print(
+            "{:<24} {:>10} {:>10} {:>10}".format(
+                "stage", "calls", "total (s)", "self (s)"
+            ),
+            file=file,
+        )
+        timers = sorted(data["timers"].items(), key=lambda i: -i[1]["self"])
+        for name, t in timers:
+            print(
+                "{:<24} {:10d} {:10.3f} {:10.3f}".format(
+                    name, t["calls"], t["total"], t["self"]
+                ),
+                file=file,
+            )
+    for name, value in sorted(data["counters"].items()):
+        print("{:<24} {:10d}".format(name, value), file=file)
+
+
+def write_json(path: str):
+    """Write the summary to a JSON file"""
+    with open(path, "w") as f:
+        json.dump(summary(), f, indent=2, sort_keys=True)
+        f.write("\n")
@@ -4,6 +4,10 @@ import click
 import logging
 from .postfslint import ActionType, DupList
 from . import rules
+from ..journal import Journal
+from .. import stats as stats_
+from ..cli import collect_stats, stats_options
+from contextlib import ExitStack
 from itertools import filterfalse
 
 
@@ -15,16 +19,85 @@ from itertools import filterfalse
     help="read tsv of duplicates with annotated actions",
     type=click.File("r"),
 )
+@click.option(
+    "-p",
+    "--plan",
+    help="read a binary plan of duplicates with annotated actions",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    "-S",
+    "--scan",
+    help="find duplicates in a directory (may be repeated)",
+    type=click.Path(exists=True),
+    multiple=True,
+)
+@click.option(
+    "--similar",
+    help="with --scan, find visually similar images rather than identical files "
+    "(requires Pillow)",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--distance",
+    help="maximum number of differing bits (of 64) between the hashes of similar "
+    "images",
+    type=click.IntRange(min=0, max=63),
+    default=4,
+    show_default=True,
+)
+@click.option(
+    "-j",
+    "--jobs",
+    help="number of threads used for hashing (--scan) and applying actions",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+)
+@click.option(
+    "-I",
+    "--index",
+    help="hash index to reuse and update with --scan, or to read duplicates from. "
+    "Its hashes also check LINK and CLONE actions before they are applied.",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "--new-only",
+    help="only list groups which gained members in the latest --scan",
+    is_flag=True,
+    default=False,
+)
 @click.option(
     "-s", "--suggest", help="apply suggestion rules", is_flag=True, default=False
 )
 @click.option("-a", "--apply", help="apply actions", is_flag=True, default=False)
+@click.option(
+    "--async-io",
+    is_flag=True,
+    default=False,
+    help="With --apply, keep many file operations in flight at once with asyncio, "
+    "which helps on network file systems",
+)
+@click.option(
+    "--mount-limit",
+    multiple=True,
+    metavar="[MOUNT=]N",
+    help="With --async-io, the number of operations in flight on each mount, or "
+    "on a given mount point. May be repeated.",
+)
 @click.option(
     "-o",
     "--out",
     help="write tsv of duplicates with suggested actions",
     type=click.File("w"),
 )
+@click.option(
+    "--write-plan",
+    help="write a binary plan of duplicates with suggested actions, which loads "
+    "faster than tsv",
+    type=click.Path(dir_okay=False, writable=True),
+)
 @click.option(
     "-K",
     "--no-keeps",
@@ -32,6 +105,17 @@ from itertools import filterfalse
     is_flag=True,
     default=False,
 )
+@click.option(
+    "--journal",
+    help="Record applied actions in this journal, to resume or roll back the run",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="Skip operations the journal lists as completed",
+)
 @click.option(
     "-n",
     "--dry-run",
@@ -39,50 +123,167 @@ from itertools import filterfalse
     default=False,
     help="Do not actually perform file moves",
 )
+@stats_options()
 @click.option("-v", "--verbose", is_flag=True, help="Verbose logging")
 @click.help_option("-h", "--help")
-def main(fslint, tsv, apply, out, no_keeps, dry_run, verbose):
-    "Deal with duplicate images"
+def main(
+    fslint,
+    tsv,
+    plan,
+    scan,
+    similar,
+    distance,
+    jobs,
+    index,
+    new_only,
+    suggest,
+    apply,
+    async_io,
+    mount_limit,
+    out,
+    write_plan,
+    no_keeps,
+    journal,
+    resume,
+    dry_run,
+    stats,
+    stats_json,
+    profile,
+    verbose,
+):
+    """Deal with duplicate images
+
+    Groups are processed one at a time (read, annotated, filtered, applied and
+    written), so output starts immediately and memory use does not depend on the
+    number of duplicates.
+    """
 
     logging.basicConfig(
         format="%(levelname)s: %(message)s",
-        level=logging.DEBUG if args.verbose else logging.INFO,
+        level=logging.DEBUG if verbose else logging.INFO,
     )
+    collect_stats(stats, stats_json, profile)
 
     # input
-    if not (args.fslint or args.tsv):
+    readinputs = [bool(fslint), bool(tsv), bool(plan)]
+    inputs = readinputs + [bool(scan or (index and not any(readinputs)))]
+    if not any(inputs):
         logging.error("No input specified")
         sys.exit(1)
-    if args.fslint and args.tsv:
+    if sum(inputs) > 1:
         logging.error("Expected exactly one input option")
         sys.exit(1)
 
-    # Read input
-    duplist = DupList(fslint=args.fslint, tsv=args.tsv)
+    if similar and not scan:
+        logging.error("--similar requires --scan")
+        sys.exit(1)
+    if similar:
+        # the optional subsystems are only imported when used, for fast startup
+        from . import similar as similar_
+
+        if not similar_.available():
+            logging.error("--similar requires Pillow (pip install kamaji[similar])")
+            sys.exit(1)
 
-    if args.suggest:
-        # Apply rules
-        duplist.annotate(rules.defaultrules)
+    if new_only and not index:
+        logging.error("--new-only requires --index")
+        sys.exit(1)
 
-    if args.nokeeps:
-        # Filter out all=KEEP groups
-        duplist[:] = filterfalse(
-            lambda g: all(a.type == ActionType.KEEP for a in g), duplist
-        )
+    if resume and not journal:
+        logging.error("--resume requires --journal")
+        sys.exit(1)
 
-    if args.apply:
-        duplist.apply(args.dryrun)
+    if async_io or mount_limit:
+        from .. import aio
 
-    # Write output
-    if args.out:
         try:
-            duplist.write(args.out)
-        except BrokenPipeError as ex:
-            pass  # piping is fine
-        except IOError as ex:
+            limit, limits = aio.parse_limits(mount_limit)
+        except ValueError as ex:
             logging.error(ex)
             sys.exit(1)
 
+    # close everything, finishing queued actions, even if a stage fails
+    with ExitStack() as resources:
+        hashindex = None
+        if index:
+            from .index import HashIndex
+
+            hashindex = resources.enter_context(HashIndex(index))
+
+        # Read input
+        if fslint:
+            groups = DupList.iter_fslint(fslint)
+        elif tsv:
+            groups = DupList.iter_tsv(tsv)
+        elif plan:
+            try:
+                groups = iter(DupList(plan=plan))
+            except ValueError as ex:
+                logging.error(ex)
+                sys.exit(1)
+        else:
+            if similar:
+                groups = similar_.find_similar(scan, distance=distance, jobs=jobs)
+            elif not scan:
+                groups = hashindex.duplicates(new_only=new_only)
+            else:
+                from .scan import find_duplicates
+
+                groups = find_duplicates(scan, jobs=jobs, index=hashindex)
+                if new_only:
+                    groups = filter(hashindex.gained, groups)
+        groups = stats_.iterate("uniq.read", groups)
+
+        if suggest:
+            # Apply rules
+            groups = rules.RuleSet(rules.defaultrules).annotate(groups)
+            groups = stats_.iterate("uniq.annotate", groups)
+
+        if no_keeps:
+            # Filter out all=KEEP groups
+            groups = filterfalse(
+                lambda g: all(a.type == ActionType.KEEP for a in g), groups
+            )
+
+        if apply:
+            from .executor import AsyncExecutor, Executor
+
+            actionjournal = None
+            if journal and not dry_run:
+                actionjournal = resources.enter_context(Journal(journal, resume=resume))
+            if async_io:
+                fs = aio.AsyncFS(limit, limits)
+                resources.callback(fs.close)
+                executor = AsyncExecutor(
+                    fs, dryrun=dry_run, journal=actionjournal, index=hashindex
+                )
+            else:
+                executor = Executor(
+                    jobs=jobs, dryrun=dry_run, journal=actionjournal, index=hashindex
+                )
+            resources.enter_context(executor)
+            groups = stats_.iterate("uniq.apply", executor.apply(groups))
+
+        # Write output
+        if write_plan:
+            from .plan import PlanWriter
+
+            planwriter = resources.enter_context(PlanWriter(write_plan))
+            groups = planwriter.record(groups)
+        if out:
+            try:
+                with stats_.timer("uniq.write"):
+                    DupList.write_groups(out, groups)
+            except BrokenPipeError as ex:
+                pass  # piping is fine
+            except IOError as ex:
+                logging.error(ex)
+                sys.exit(1)
+
+        # Finish any remaining groups, e.g. actions after the output pipe was closed
+        for group in groups:
+            pass
+
 
 if __name__ == "__main__":
     main()
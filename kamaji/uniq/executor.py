@@ -0,0 +1,241 @@
+"""Apply the actions of many groups concurrently"""
+
+import abc
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .postfslint import ActionType
+from . import postfslint
+from ..aio import LoopThread
+from ..journal import DELETE
+from .. import stats
+
+
+class BaseExecutor(abc.ABC):
+    """Applies the actions of many DupGroups
+
+    Groups are independent, so several are applied at once. Within a group,
+    actions run one after another in their original order. Groups which only
+    delete files are deferred and removed in batches of `batch_size` paths, which
+    takes a single `trash` call per batch when trash is installed. Success and
+    failure are still logged for each action, and progress is logged every
+    `progress` groups.
+
+    Subclasses decide where the tasks run, by implementing `_run` and `close`. Use
+    as a context manager, or call `close` to finish outstanding actions.
+    """
+
+    def __init__(
+        self,
+        slots,
+        batch_size=1000,
+        progress=10000,
+        dryrun=False,
+        journal=None,
+        index=None,
+    ):
+        """
+        Args:
+            - slots (int): number of tasks queued at once
+            - batch_size (int): number of paths deleted together
+            - progress (int): log progress after this many groups
+            - dryrun (bool): only log the actions
+            - journal (journal.Journal): record actions, skipping completed ones
+            - index (index.HashIndex): cached hashes for checking LINK and CLONE
+              actions
+        """
+        self.batch_size = batch_size
+        self.journal = journal
+        self.index = index
+        self.progress = progress
+        self.dryrun = dryrun
+        # limit queued tasks
+        self.slots = threading.BoundedSemaphore(slots)
+        self.deletes = []
+        self.lock = threading.Lock()
+        self.groups = 0
+        self.done = 0
+        self.failed = 0
+
+    def submit(self, group):
+        """Queue the actions of a group"""
+        self.groups += 1
+        if self.dryrun:
+            group.apply(dryrun=True)
+        else:
+            actions = [
+                action
+                for action in group
+                if action.type not in (ActionType.KEEP, ActionType.UNKNOWN)
+            ]
+            if all(action.type is ActionType.DELETE for action in actions):
+                self.deletes.extend(actions)
+                if len(self.deletes) >= self.batch_size:
+                    self.flush()
+            else:
+                # e.g. a RENAME onto a file deleted earlier in the group
+                self._run(self._apply, actions)
+        if self.progress and self.groups % self.progress == 0:
+            self.report()
+
+    def apply(self, groups):
+        """Queue the actions of each group as it passes through
+
+        Yields: each group, after queueing its actions
+        """
+        for group in groups:
+            self.submit(group)
+            yield group
+
+    def flush(self):
+        """Start deleting the queued DELETE actions"""
+        if self.deletes:
+            self._run(self._delete, self.deletes)
+            self.deletes = []
+
+    @abc.abstractmethod
+    def close(self):
+        """Wait for all actions to finish"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def report(self):
+        with self.lock:
+            logging.info(
+                "Applied %d groups: %d actions done, %d failed",
+                self.groups,
+                self.done,
+                self.failed,
+            )
+
+    @abc.abstractmethod
+    def _run(self, func, actions):
+        """Start func(actions) in the background, after acquiring a slot"""
+
+    def _finished(self, future):
+        self.slots.release()
+        if future.exception() is not None:
+            logging.error(future.exception())
+
+    def _count(self, done=0, failed=0):
+        with self.lock:
+            self.done += done
+            self.failed += failed
+
+    def _apply(self, actions):
+        with stats.timer("uniq.actions"):
+            self._apply_all(actions)
+
+    def _apply_all(self, actions):
+        for action in actions:
+            try:
+                action.apply(journal=self.journal, index=self.index)
+            except Exception as ex:
+                logging.error(ex)
+                self._count(failed=1)
+            else:
+                self._count(done=1)
+
+    def _delete(self, actions):
+        with stats.timer("uniq.delete"):
+            self._delete_all(actions)
+
+    def _delete_all(self, actions):
+        journal = self.journal
+        paths = []
+        for action in actions:
+            if journal is not None and journal.is_done(*action.journal_key()):
+                logging.debug("Already done: %s", action)
+                self._count(done=1)
+                continue
+            try:
+                action.check_path()
+            except IOError as ex:
+                logging.error(ex)
+                self._count(failed=1)
+            else:
+                paths.append(action.path)
+        if not paths:
+            return
+        if journal is not None:
+            for path in paths:
+                journal.plan(DELETE, path)
+        # failures are logged by delete_many
+        failed = postfslint.delete_many(paths)
+        if journal is not None:
+            failedset = set(failed)
+            for path in paths:
+                if path not in failedset:
+                    journal.done(DELETE, path)
+        self._count(done=len(paths) - len(failed), failed=len(failed))
+
+
+class Executor(BaseExecutor):
+    """Applies the actions of many DupGroups in a bounded thread pool"""
+
+    def __init__(self, jobs=4, **kwargs):
+        """
+        Args:
+            - jobs (int): number of worker threads
+            - kwargs: see `BaseExecutor`
+        """
+        super().__init__(slots=2 * jobs, **kwargs)
+        self.pool = ThreadPoolExecutor(jobs)
+
+    def _run(self, func, actions):
+        self.slots.acquire()
+        future = self.pool.submit(func, actions)
+        future.add_done_callback(self._finished)
+
+    def close(self):
+        """Wait for all actions to finish"""
+        self.flush()
+        self.pool.shutdown(wait=True)
+        self.report()
+
+
+class AsyncExecutor(BaseExecutor):
+    """Applies the actions of many DupGroups with many file operations in flight
+
+    Tasks are scheduled on an asyncio event loop in a background thread. Each
+    group, or batch of deletes, runs in one of the threads of an `aio.AsyncFS`,
+    within its limit for the mount holding the group's first file.
+    """
+
+    def __init__(self, fs, inflight=256, **kwargs):
+        """
+        Args:
+            - fs (aio.AsyncFS): runs the blocking file operations
+            - inflight (int): number of groups or delete batches queued at once
+            - kwargs: see `BaseExecutor`
+        """
+        super().__init__(slots=inflight, **kwargs)
+        self.fs = fs
+        self.loop = LoopThread()
+        self.futures = set()
+
+    def _run(self, func, actions):
+        self.slots.acquire()
+        future = self.loop.submit(self.fs.call(actions[0].path, func, actions))
+        with self.lock:
+            self.futures.add(future)
+        future.add_done_callback(self._finished)
+
+    def _finished(self, future):
+        with self.lock:
+            self.futures.discard(future)
+        super()._finished(future)
+
+    def close(self):
+        """Wait for all actions to finish"""
+        self.flush()
+        with self.lock:
+            futures = list(self.futures)
+        wait(futures)
+        self.loop.close()
+        self.report()
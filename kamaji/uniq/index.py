@@ -0,0 +1,213 @@
+"""Persistent index of file hashes
+
+Records the size, mtime, inode and hashes of every file seen by
+`scan.find_duplicates`, so later scans only hash new or changed files. Groups of
+duplicates can also be read straight from the index.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Iterator, Optional, Tuple
+
+from .postfslint import DupGroup
+
+
+class HashIndex:
+    """SQLite index of file hashes
+
+    Each scan is a numbered run. Files which are new or changed since the previous
+    run are marked as added in the current run, which allows listing only groups
+    of duplicates that gained members.
+    """
+
+    def __init__(self, path: str):
+        """Open or create an index
+
+        Args:
+            - path (str): SQLite database file
+        """
+        self.path = path
+        self.db = sqlite3.connect(path)
+        # read-only connections for `lookup` from other threads
+        self.local = threading.local()
+        self.readers = []
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY,
+                started REAL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime INTEGER,
+                inode INTEGER,
+                partial BLOB,
+                full BLOB,
+                added INTEGER,
+                seen INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS files_full ON files (size, full);
+            """
+        )
+        row = self.db.execute("SELECT MAX(id) FROM runs").fetchone()
+        self.run = row[0] or 0
+
+    def begin(self):
+        """Start a new run"""
+        cursor = self.db.execute(
+            "INSERT INTO runs (started) VALUES (?)", (time.time(),)
+        )
+        self.run = cursor.lastrowid
+
+    def update(
+        self, path: str, st: os.stat_result
+    ) -> Tuple[Optional[bytes], Optional[bytes]]:
+        """Record that a file was seen in the current run
+
+        Stored hashes are discarded if the file's size, mtime or inode changed.
+
+        Args:
+            - path (str): file name
+            - st (os.stat_result): current stat of the file
+
+        Returns: (partial, full) hashes still valid for the file, or None
+        """
+        path = os.path.abspath(path)
+        identity = (st.st_size, st.st_mtime_ns, st.st_ino)
+        row = self.db.execute(
+            "SELECT size, mtime, inode, partial, full FROM files WHERE path = ?",
+            (path,),
+        ).fetchone()
+        if row is not None and tuple(row[:3]) == identity:
+            self.db.execute(
+                "UPDATE files SET seen = ? WHERE path = ?", (self.run, path)
+            )
+            return row[3], row[4]
+        self.db.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, NULL, NULL, ?, ?)",
+            (path,) + identity + (self.run, self.run),
+        )
+        return None, None
+
+    def set_hashes(
+        self, path: str, partial: Optional[bytes] = None, full: Optional[bytes] = None
+    ):
+        """Store hashes for a file previously recorded with `update`"""
+        path = os.path.abspath(path)
+        if partial is not None:
+            self.db.execute(
+                "UPDATE files SET partial = ? WHERE path = ?", (partial, path)
+            )
+        if full is not None:
+            self.db.execute("UPDATE files SET full = ? WHERE path = ?", (full, path))
+
+    def lookup(self, path: str, st: os.stat_result) -> Optional[bytes]:
+        """Full hash of a file, if it is stored and the file is unchanged
+
+        Unlike the other methods, this may be called from any thread. It only sees
+        hashes which have been committed.
+
+        Args:
+            - path (str): file name
+            - st (os.stat_result): current stat of the file
+
+        Returns: full hash, or None
+        """
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = self.local.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.readers.append(db)
+        row = db.execute(
+            "SELECT size, mtime, inode, full FROM files WHERE path = ?",
+            (os.path.abspath(path),),
+        ).fetchone()
+        if row is not None and tuple(row[:3]) == (
+            st.st_size,
+            st.st_mtime_ns,
+            st.st_ino,
+        ):
+            return row[3]
+        return None
+
+    def prune(self, roots: Iterable[str]):
+        """Forget files under `roots` which were not seen in the current run"""
+        for clause, args in self._under(roots):
+            self.db.execute(
+                "DELETE FROM files WHERE seen < ? AND ({})".format(clause),
+                (self.run,) + args,
+            )
+
+    def gained(self, group: Iterable) -> bool:
+        """Whether any member of a group was added or changed in the current run"""
+        for action in group:
+            row = self.db.execute(
+                "SELECT added FROM files WHERE path = ?",
+                (os.path.abspath(action.path),),
+            ).fetchone()
+            if row is not None and row[0] == self.run:
+                return True
+        return False
+
+    def duplicates(
+        self, roots: Optional[Iterable[str]] = None, new_only: bool = False
+    ) -> Iterator[DupGroup]:
+        """Groups of files with identical content, largest first
+
+        Args:
+            - roots (list of str): only consider files under these paths
+            - new_only (bool): only groups which gained members in the current run
+
+        Yields: DupGroup of UNKNOWN actions
+        """
+        where, args = "full IS NOT NULL", ()
+        if roots is not None:
+            clauses = list(self._under(roots))
+            where += " AND ({})".format(" OR ".join(c for c, a in clauses))
+            args = sum((a for c, a in clauses), ())
+        query = """
+            SELECT path, size, full, added FROM files WHERE {0} AND (size, full) IN (
+                SELECT size, full FROM files WHERE {0}
+                GROUP BY size, full HAVING COUNT(*) > 1
+            ) ORDER BY size DESC, full, path""".format(
+            where
+        )
+        group, key, new = [], None, False
+        for path, size, full, added in self.db.execute(query, args * 2):
+            if (size, full) != key:
+                if group and (new or not new_only):
+                    yield DupGroup(paths=group)
+                group, key, new = [], (size, full), False
+            group.append(path)
+            new = new or added == self.run
+        if group and (new or not new_only):
+            yield DupGroup(paths=group)
+
+    @staticmethod
+    def _under(roots: Iterable[str]) -> Iterator[Tuple[str, tuple]]:
+        """SQL conditions matching paths equal to or below each root"""
+        for root in roots:
+            root = os.path.abspath(root).rstrip(os.sep)
+            # '0' sorts right after '/'
+            yield "path = ? OR (path >= ? AND path < ?)", (
+                root,
+                root + os.sep,
+                root + chr(ord(os.sep) + 1),
+            )
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+        for db in self.readers:
+            db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,153 @@
+"""Replace duplicates with links to a kept copy
+
+LINK actions replace a file with a hard link to the kept copy. CLONE actions
+replace it with a reflink, which is a copy that shares the kept copy's data blocks
+until either file is modified (Btrfs, XFS and other file systems supporting
+`FICLONE`). Neither copies any data, so applying many of them costs little more
+than the metadata updates.
+
+Before a file is replaced, its content is checked against the kept copy. Hashes
+cached in a `HashIndex` are compared when both files are unchanged since they were
+indexed. Otherwise the files are compared directly, which stops at the first
+difference. The replacement is created under a temporary name in the same
+directory and renamed over the file, so the path never goes missing.
+"""
+
+import errno
+import logging
+import os
+import shutil
+import uuid
+
+from .. import stats
+
+try:
+    import fcntl
+except ImportError:  # not unix
+    fcntl = None
+
+# _IOW(0x94, 9, int), from linux/fs.h
+FICLONE = 0x40049409
+# read size for comparing files
+CHUNK = 1 << 20
+
+
+def reflink(src: str, dst: str):
+    """Create dst as a reflink of src
+
+    Raises: (OSError) if dst exists or the file system can't clone files
+    """
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported", dst)
+    fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with open(src, "rb") as fsrc:
+            fcntl.ioctl(fd, FICLONE, fsrc.fileno())
+    except BaseException:
+        os.close(fd)
+        os.unlink(dst)
+        raise
+    os.close(fd)
+
+
+def _compare(a: str, b: str) -> bool:
+    """Whether two files of the same size have the same content"""
+    with open(a, "rb") as fa, open(b, "rb") as fb:
+        while True:
+            chunk = fa.read(CHUNK)
+            stats.count("link.bytes_compared", 2 * len(chunk))
+            if chunk != fb.read(CHUNK):
+                return False
+            if not chunk:
+                return True
+
+
+def same_content(path: str, kept: str, index=None) -> bool:
+    """Whether two files have the same content
+
+    Args:
+        - path (str): file to compare
+        - kept (str): file to compare with
+        - index (HashIndex): if given, compare cached hashes of unchanged files
+          instead of reading them
+    """
+    st, keptst = os.stat(path), os.stat(kept)
+    if st.st_size != keptst.st_size:
+        return False
+    if (st.st_dev, st.st_ino) == (keptst.st_dev, keptst.st_ino):
+        return True
+    if index is not None:
+        digest, keptdigest = index.lookup(path, st), index.lookup(kept, keptst)
+        if digest is not None and keptdigest is not None:
+            stats.count("link.cached")
+            return digest == keptdigest
+    return _compare(path, kept)
+
+
+def _temporary(path: str, create) -> str:
+    """Call create(tmp) with an unused file name next to path
+
+    Returns: tmp
+    """
+    head, tail = os.path.split(path)
+    while True:
+        tmp = os.path.join(head, ".{}.{}.kamaji".format(tail, uuid.uuid4().hex[:8]))
+        try:
+            create(tmp)
+        except FileExistsError:
+            continue
+        return tmp
+
+
+def replace(path: str, kept: str, clone: bool = False, index=None) -> bool:
+    """Replace a file with a hard link to (or clone of) a file with the same content
+
+    A clone keeps the permissions and times of the replaced file. A hard link
+    shares those of the kept copy.
+
+    Args:
+        - path (str): file to replace
+        - kept (str): file to link to
+        - clone (bool): make a reflink rather than a hard link
+        - index (HashIndex): cached hashes for checking the content
+
+    Returns: (bool) True
+
+    Raises:
+        - IOError: the content differs
+        - OSError: the link could not be made, e.g. across file systems
+    """
+    verb = "clone" if clone else "link"
+    if not os.path.isfile(kept):
+        raise IOError("Unable to %s '%s' (file not found)" % (verb, kept))
+    if os.path.samefile(path, kept):
+        logging.debug("%s is already linked to %s", path, kept)
+        return True
+    if not same_content(path, kept, index):
+        raise IOError(
+            "Unable to %s '%s' (content differs from '%s')" % (verb, path, kept)
+        )
+    try:
+        if clone:
+            logging.info("Replacing %s with a clone of %s", path, kept)
+            tmp = _temporary(path, lambda tmp: reflink(kept, tmp))
+        else:
+            logging.info("Replacing %s with a link to %s", path, kept)
+            tmp = _temporary(path, lambda tmp: os.link(kept, tmp))
+    except OSError as ex:
+        # e.g. EXDEV or EOPNOTSUPP, reported for the temporary file
+        raise OSError(
+            ex.errno, "Unable to %s '%s' (%s)" % (verb, path, ex.strerror)
+        ) from None
+    try:
+        if clone:
+            shutil.copystat(path, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    stats.count("link.replaced")
+    return True
@@ -0,0 +1,238 @@
+"""Binary plan files
+
+A compact alternative to the TSV action file, for plans too large to re-parse on
+every run. A plan file is memory mapped and read in place: nothing is parsed until
+a path is accessed. Convert between the formats with `kamaji uniq`, e.g.
+`-t plan.tsv --write-plan plan.bin` and `-p plan.bin -o plan.tsv`.
+
+Layout (all integers little-endian):
+
+- magic, 8 bytes
+- strings: each a uint32 byte length followed by UTF-8 encoded text
+- type column: one byte per action, the ASCII code of its ActionType (as in TSV
+  files, e.g. `D`)
+- padding to a multiple of 8 bytes
+- path column: one uint64 per action, the file offset of its path string
+- argument column: one uint64 per action, the offset of its argument string, or
+  NO_ARG. Actions take at most one argument (e.g. the destination of a RENAME).
+- group column: n_groups + 1 uint64 indices of the first action of each group,
+  followed by the total number of actions
+- footer: FOOTER, giving the number of groups and actions and the offset of
+  each column, followed by the magic again
+
+The last two bytes of the magic are the format version (VERSION, little-endian).
+
+Since the columns follow the strings, plans are written in one pass as groups are
+produced.
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from typing import Iterable, Iterator
+
+from .postfslint import nargs
+from .store import GroupStore, _codes
+
+VERSION = 1
+MAGIC = b"KAMAJI" + struct.pack("<H", VERSION)
+# n_groups, n_actions, types, paths, args, groups, magic
+FOOTER = struct.Struct("<QQQQQQ8s")
+NO_ARG = 2**64 - 1
+_length = struct.Struct("<I")
+# bytes of strings buffered before writing
+BUFFER = 1 << 20
+
+
+class PlanWriter(object):
+    """Writes groups to a binary plan file
+
+    Use as a context manager, or call `close` to write the columns and footer.
+    """
+
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.pos = len(MAGIC)
+        self.buffer = bytearray()
+        self.types = bytearray()
+        self.paths = array("Q")
+        self.args = array("Q")
+        self.groups = array("Q", [0])
+
+    def _string(self, s: str) -> int:
+        data = s.encode("utf-8", "surrogateescape")
+        pos = self.pos + len(self.buffer)
+        self.buffer += _length.pack(len(data))
+        self.buffer += data
+        return pos
+
+    def _flush(self):
+        self.file.write(self.buffer)
+        self.pos += len(self.buffer)
+        self.buffer = bytearray()
+
+    def write(self, group: Iterable):
+        """Add a group of actions"""
+        for action in group:
+            args = action.args
+            if len(args) > 1:
+                raise ValueError("Too many arguments to store %s" % action)
+            self.types.append(_codes[action.type])
+            self.paths.append(self._string(action.path))
+            self.args.append(self._string(args[0]) if args else NO_ARG)
+        self.groups.append(len(self.types))
+        if len(self.buffer) >= BUFFER:
+            self._flush()
+
+    def record(self, groups: Iterable) -> Iterator:
+        """Write each group as it passes through
+
+        Yields: each group, after writing it
+        """
+        for group in groups:
+            self.write(group)
+            yield group
+
+    def close(self):
+        if self.file.closed:
+            return
+        self._flush()
+        f = self.file
+        types = self.pos
+        f.write(self.types)
+        pos = types + len(self.types)
+        padding = -pos % 8
+        f.write(b"\0" * padding)
+        offsets = []
+        pos += padding
+        for column in (self.paths, self.args, self.groups):
+            offsets.append(pos)
+            if sys.byteorder != "little":
+                column = array("Q", column)
+                column.byteswap()
+            f.write(column.tobytes())
+            pos += len(column) * column.itemsize
+        f.write(
+            FOOTER.pack(len(self.groups) - 1, len(self.types), types, *offsets, MAGIC)
+        )
+        f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write(path: str, groups: Iterable):
+    """Write groups to a binary plan file"""
+    with PlanWriter(path) as writer:
+        for group in groups:
+            writer.write(group)
+
+
+class PlanStore(GroupStore):
+    """Groups of actions read from a memory-mapped binary plan
+
+    Behaves like a `GroupStore`. Action types can be changed (e.g. by annotating
+    groups), but changes are not written back to the file. The store can't be
+    extended.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            - path (str): plan file
+
+        Raises: (ValueError) if the file is not a valid binary plan
+        """
+        self.filename = path
+        with open(path, "rb") as f:
+            try:
+                self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            except ValueError:
+                raise ValueError("%s: empty file" % path)
+        mm = self.mmap
+        if len(mm) < len(MAGIC) + FOOTER.size or mm[:6] != MAGIC[:6]:
+            raise ValueError("%s: not a binary plan" % path)
+        if mm[: len(MAGIC)] != MAGIC:
+            (version,) = struct.unpack_from("<H", mm, 6)
+            raise ValueError(
+                "%s: unsupported binary plan version %d (expected %d)"
+                % (path, version, VERSION)
+            )
+        ngroups, nactions, types, paths, args, groups, magic = FOOTER.unpack_from(
+            mm, len(mm) - FOOTER.size
+        )
+        if magic != MAGIC:
+            raise ValueError("%s: truncated binary plan" % path)
+        view = self.view = memoryview(mm)
+        # the mapping is copy-on-write, so annotation doesn't change the file
+        self.types = view[types : types + nactions]
+        self.paths = self._column(view, paths, nactions)
+        self.argoffsets = self._column(view, args, nactions)
+        self.offsets = self._column(view, groups, ngroups + 1)
+        self._check(view[args : args + 8 * nactions])
+
+    def _check(self, argbytes: memoryview):
+        """Check the type codes, and that actions have the right number of arguments
+
+        Raises: (ValueError) for the first invalid action
+        """
+        # code -> 1 + number of arguments, or 0 for unknown codes
+        table = bytearray(256)
+        for t, code in _codes.items():
+            table[code] = 1 + nargs.get(t, 0)
+        kinds = bytes(self.types).translate(table)
+        if 0 in kinds:
+            i = kinds.index(0)
+            raise ValueError(
+                "%s: unknown action type %r at action %d"
+                % (self.filename, chr(self.types[i]), i)
+            )
+        if 2 not in kinds:
+            # no arguments expected: all offsets are NO_ARG
+            if argbytes != b"\xff" * len(argbytes):
+                i = next(i for i, pos in enumerate(self.argoffsets) if pos != NO_ARG)
+                raise ValueError(
+                    "%s: unexpected argument for action %d" % (self.filename, i)
+                )
+            return
+        for i, (kind, pos) in enumerate(zip(kinds, self.argoffsets)):
+            if (kind == 2) != (pos != NO_ARG):
+                raise ValueError(
+                    "%s: wrong number of arguments for action %d" % (self.filename, i)
+                )
+
+    @staticmethod
+    def _column(view: memoryview, start: int, n: int):
+        column = view[start : start + 8 * n].cast("Q")
+        if sys.byteorder != "little":
+            column = array("Q", column)
+            column.byteswap()
+        return column
+
+    def _string(self, pos: int) -> str:
+        (n,) = _length.unpack_from(self.mmap, pos)
+        pos += _length.size
+        return self.mmap[pos : pos + n].decode("utf-8", "surrogateescape")
+
+    def path(self, i: int) -> str:
+        return self._string(self.paths[i])
+
+    def arguments(self, i: int) -> tuple:
+        pos = self.argoffsets[i]
+        return () if pos == NO_ARG else (self._string(pos),)
+
+    def append(self, group):
+        raise TypeError("Binary plans are read-only")
+
+    def close(self):
+        """Unmap the file. Views of groups and actions can't be used afterwards."""
+        for column in (self.types, self.paths, self.argoffsets, self.offsets):
+            if isinstance(column, memoryview):
+                column.release()
+        self.view.release()
+        self.mmap.close()
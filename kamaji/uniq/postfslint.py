@@ -6,8 +6,12 @@ import abc
 from enum import Enum
 import logging
 import itertools
-from distutils import spawn  # for find_executable
+import functools
+import shutil
 import subprocess
+from .. import journal as journal_
+from .. import stats
+from . import link
 
 
 class ActionType(Enum):
@@ -16,28 +20,71 @@ class ActionType(Enum):
     KEEP = "K"
     DELETE = "D"
     RENAME = "R"
+    LINK = "L"
+    CLONE = "C"
     UNKNOWN = "?"
 
 
-# OS-specific delete function
-if spawn.find_executable("trash"):
+# number of arguments taken by each ActionType
+nargs = {
+    ActionType.RENAME: 1,
+    ActionType.LINK: 1,
+    ActionType.CLONE: 1,
+}
 
-    def delete(path):
-        logging.info("Trashing %s", path)
-        result = subprocess.check_call(
-            ["trash", path], stdout=sys.stdout, stderr=sys.stderr
-        )
-        if result != 0:
-            logging.error("Trashing {} returned {}", path, result)
-        return True
 
+@functools.lru_cache(maxsize=None)
+def trash_command():
+    """Path of the `trash` command, or None if it isn't installed
 
-else:
+    Looked up on first use rather than on import, which keeps startup fast.
+    """
+    return shutil.which("trash")
 
-    def delete(path):
+
+def delete(path):
+    """Trash a file if `trash` is installed, or delete it"""
+    trash = trash_command()
+    if trash is None:
         logging.info("Deleting %s", path)
         os.remove(path)
         return True
+    logging.info("Trashing %s", path)
+    stats.count("trash.processes")
+    result = subprocess.check_call([trash, path], stdout=sys.stdout, stderr=sys.stderr)
+    if result != 0:
+        logging.error("Trashing {} returned {}", path, result)
+    return True
+
+
+def delete_many(paths):
+    """Trash or delete several files, with a single call to `trash` if installed
+
+    Returns: list of paths which could not be trashed or deleted
+    """
+    trash = trash_command()
+    if trash is None:
+        failed = []
+        for path in paths:
+            try:
+                delete(path)
+            except OSError as ex:
+                logging.error(ex)
+                failed.append(path)
+        return failed
+    for path in paths:
+        logging.info("Trashing %s", path)
+    stats.count("trash.processes")
+    try:
+        subprocess.check_call(
+            [trash] + list(paths), stdout=sys.stdout, stderr=sys.stderr
+        )
+    except subprocess.CalledProcessError:
+        failed = [path for path in paths if os.path.lexists(path)]
+        for path in failed:
+            logging.error("Unable to trash %s", path)
+        return failed
+    return []
 
 
 def rename(src, dst):
@@ -49,6 +96,8 @@ def rename(src, dst):
 class Action(object):
     """Encapsulates an action to be performed. Actions apply to a path and may take additional arguments."""
 
+    __slots__ = ("type", "path", "args")
+
     def __init__(self, actiontype, path, *args):
         self.type = ActionType(actiontype)
         self.path = path
@@ -70,12 +119,15 @@ class Action(object):
         if self.type is ActionType.RENAME:
             if self.args is None or len(self.args) != 1:
                 raise ValueError("No destination for RENAME action")
+        elif self.type in (ActionType.LINK, ActionType.CLONE):
+            if self.args is None or len(self.args) != 1:
+                raise ValueError("No kept file for {} action".format(self.type.name))
         else:
             if self.args is not None and len(self.args) > 0:
                 raise ValueError("Too many arguments for {} action".format(self.type))
 
     def __str__(self):
-        return "\t".join([self.type.value, self.path] + list(self.args))
+        return "\t".join((self.type.value, self.path) + tuple(self.args))
 
     # @classmethod
     # def to_yaml(cls, representer, node):
@@ -92,9 +144,42 @@ class Action(object):
         fields = line.split("\t")
         return Action(*fields)
 
-    def apply(self, dryrun=False):
+    def check_path(self):
+        """Test that the path exists
+
+        Throws: (IOError) if the path is not a file
+
+        """
+        if not os.path.isfile(self.path):
+            raise IOError(
+                "Unable to %s '%s' (file not found)" % (self.type.name, self.path)
+            )
+
+    def journal_key(self):
+        """(op, src, dst) identifying this action in a journal.Journal
+
+        Returns: key, or None for actions which don't change anything
+        """
+        if self.type is ActionType.DELETE:
+            return (journal_.DELETE, self.path, "")
+        elif self.type is ActionType.RENAME:
+            return (journal_.MOVE, self.path, self.args[0])
+        elif self.type is ActionType.LINK:
+            return (journal_.LINK, self.path, self.args[0])
+        elif self.type is ActionType.CLONE:
+            return (journal_.CLONE, self.path, self.args[0])
+        return None
+
+    def apply(self, dryrun=False, journal=None, index=None):
         """Apply action
 
+        Args:
+            - dryrun (bool): only log the action
+            - journal (journal.Journal): record the action, and skip it if the
+              journal shows it was already completed
+            - index (index.HashIndex): cached hashes, used to check that LINK and
+              CLONE actions replace files with identical ones
+
         Return: (bool) whether the action was successful
 
         """
@@ -102,23 +187,41 @@ class Action(object):
             # Ignore
             return
 
-        # Test path exists
-        if not os.path.isfile(self.path):
-            raise IOError(
-                "Unable to %s '%s' (file not found)" % (self.type.name, self.path)
-            )
+        key = self.journal_key() if journal is not None and not dryrun else None
+        if key is not None and journal.is_done(*key):
+            logging.debug("Already done: %s", self)
+            return True
+
+        self.check_path()
+        if key is not None:
+            journal.plan(*key)
         if self.type is ActionType.DELETE:
             if dryrun:
                 logging.info("Deleting %s", self.path)
             else:
-                return delete(self.path)
+                result = delete(self.path)
         elif self.type is ActionType.RENAME:
             if dryrun:
                 logging.info("Renaming %s to %s", self.path, self.args[0])
             else:
-                return rename(self.path, self.args[0])
+                result = rename(self.path, self.args[0])
+        elif self.type is ActionType.LINK:
+            if dryrun:
+                logging.info("Replacing %s with a link to %s", self.path, self.args[0])
+            else:
+                result = link.replace(self.path, self.args[0], index=index)
+        elif self.type is ActionType.CLONE:
+            if dryrun:
+                logging.info("Replacing %s with a clone of %s", self.path, self.args[0])
+            else:
+                result = link.replace(self.path, self.args[0], clone=True, index=index)
         else:
             raise Exception("Unimplemented Action")
+        if dryrun:
+            return
+        if key is not None:
+            journal.done(*key)
+        return result
 
 
 class DupGroup(UserList):
@@ -132,6 +235,10 @@ class DupGroup(UserList):
         else:
             super().__init__(Action(ActionType.UNKNOWN, path) for path in paths)
 
+    def __iter__(self):
+        # UserList would iterate through __getitem__
+        return iter(self.data)
+
     def annotate(self, rules):
         """Apply a set of rules to the actions
         Args:
@@ -168,17 +275,85 @@ class DupGroup(UserList):
     def __str__(self):
         return "\n".join(str(a) for a in self)
 
-    def apply(self, dryrun=False):
+    def apply(self, dryrun=False, journal=None):
         """Apply actions"""
         for action in self:
             allworked = True
             try:
-                allworked = allworked and action.apply(dryrun)
+                allworked = allworked and action.apply(dryrun, journal)
             except Exception as ex:
                 logging.error(ex)
 
 
+# fslint section header, e.g. "-----DUPlicate files"
+fslint_section = re.compile("-{5,}(.*)\n?")
+
+
 class DupList(UserList):
+    @staticmethod
+    def iter_fslint(file):
+        """Iterate over groups of duplicates in fslint output, reading it lazily
+
+        Groups are read from the "DUPlicate files" section or, if there is none,
+        from the lines before the first section header (e.g. plain `findup` output).
+        A seekable file is first searched for the section, without parsing it.
+        Otherwise, lines before the first header are always used, since they are
+        yielded before any later sections are seen.
+
+        Args:
+            - file (file-like): fslint output file
+
+        Yields: DupGroup
+        """
+        dupsection = "DUPlicate files"
+        hasdups = DupList._has_section(file, dupsection)
+        sectionname = None  # top section
+        topgroups = 0
+        paths = []
+        for line in file:
+            match = fslint_section.match(line)
+            if match:
+                # new section
+                if paths:
+                    yield DupGroup(paths=paths)
+                    paths = []
+                    topgroups += sectionname is None
+                sectionname = match.group(1)
+                if sectionname == dupsection and hasdups is None and topgroups:
+                    logging.warning("Using the lines before %s too", line.strip())
+            elif sectionname == dupsection or (sectionname is None and not hasdups):
+                line = line.rstrip("\n")
+                if line:
+                    paths.append(line)
+                elif paths:
+                    yield DupGroup(paths=paths)
+                    paths = []
+                    topgroups += sectionname is None
+        if paths:
+            yield DupGroup(paths=paths)
+
+    @staticmethod
+    def _has_section(file, name):
+        """Whether a seekable fslint output file has a section
+
+        Returns: (bool) or None, if the file is not seekable
+        """
+        try:
+            if not file.seekable():
+                return None
+            start = file.tell()
+        except (AttributeError, OSError):
+            return None
+        try:
+            for line in file:
+                if line.startswith("-----"):
+                    match = fslint_section.match(line)
+                    if match and match.group(1) == name:
+                        return True
+            return False
+        finally:
+            file.seek(start)
+
     @staticmethod
     def parse_fslint(file):
         """
@@ -193,7 +368,7 @@ class DupList(UserList):
         sectionname = None
         section = []
         for line in lines:
-            match = re.match("-{5,}(.*)\n?", line)
+            match = fslint_section.match(line)
             if match:
                 # new section
                 if section or sectionname:
@@ -217,20 +392,33 @@ class DupList(UserList):
         ]
         return dups
 
-    def __init__(self, fslint=None, tsv=None):
+    def __init__(self, fslint=None, tsv=None, compact=False, plan=None):
         """
         Args:
             - fslint (file-like): fslint output to parser
+            - tsv (file-like): tsv action file to read
+            - compact (bool): store groups in a `store.GroupStore`, which uses a
+              fraction of the memory. Groups are then returned as
+              `store.GroupView`s.
+            - plan (str): binary plan file to load (see `plan`). The file is
+              memory mapped, and the list can't be extended.
         """
         super().__init__()
+        if plan:
+            from .plan import PlanStore
+
+            self.data = PlanStore(plan)
+        elif compact:
+            from .store import GroupStore
+
+            self.data = GroupStore()
         if fslint:
             self.read_fslint(fslint)
         if tsv:
             self.read_tsv(tsv)
 
     def read_fslint(self, fslint):
-        sections = self.parse_fslint(fslint)
-        self.extend(self.fslint_duplist(sections))
+        self.extend(self.iter_fslint(fslint))
 
     def read_tsv(self, tsv):
         """Read a tsv action file.
@@ -240,50 +428,80 @@ class DupList(UserList):
 
         Adds any actions read to this list.
         """
-        # group by newlines
-        dups = []
-        actions = []
-        for linenum, line in enumerate(tsv.readlines()):
-            line = line.rstrip("\n")
-            if line:
-                if line[0] == "#":
-                    continue
-                # continue group
-                try:
-                    action = Action.from_tsv(line)
-                    actions.append(action)
-                except ValueError as ex:
-                    logging.error("Parse error line {}: {}".format(linenum, ex))
-            else:
-                # start new group
-                if actions:
-                    dups.append(DupGroup(actions))
-                actions = []
-        if actions:
-            dups.append(DupGroup(actions))
+        self.extend(self.iter_tsv(tsv))
 
-        self.extend(dups)
+    @staticmethod
+    def iter_tsv(tsv):
+        """Iterate over groups in a tsv action file, reading it lazily
+
+        See `read_tsv` for the format.
+
+        Yields: DupGroup
+        """
+        from .tsv import iter_groups
+
+        return iter_groups(tsv)
 
     def __str__(self):
         """TSV-formatted string"""
         return "\n\n".join(str(dup) for dup in self)
 
-    def write(self, outfile):
-        outfile.write(
-            """# Actions:
+    header = """# Actions:
 # K\tsrc\t\tKeep the file
 # D\tsrc\t\tDelete the file
 # R\tsrc\tdst\tRename the file to `dst`
+# L\tsrc\tkept\tReplace the file with a hard link to `kept`
+# C\tsrc\tkept\tReplace the file with a reflink (copy-on-write clone) of `kept`
 # ?\tsrc\t\tUnknown - keep file as is
 """
-        )
-        outfile.write(str(self))
+
+    def write(self, outfile):
+        self.write_groups(outfile, self)
+
+    def write_plan(self, path):
+        """Write groups to a binary plan file (see `plan`)"""
+        from . import plan
+
+        plan.write(path, self)
+
+    @classmethod
+    def write_groups(cls, outfile, groups):
+        """Write groups in tsv format as they are produced
+
+        Args:
+            - outfile (file-like): output file
+            - groups (iterable of DupGroup): groups to write
+        """
+        from .tsv import write_groups
+
+        write_groups(outfile, groups, cls.header)
 
     def annotate(self, rules):
-        for dup in self:
-            dup.annotate(rules)
+        """Apply a set of rules to all groups
 
-    def apply(self, dryrun=False):
-        """Apply actions"""
-        for dup in self:
-            dup.apply(dryrun)
+        Args:
+            - rules (list of ([action] -> bool)): List of rules, see `DupGroup.annotate`
+        """
+        from .rules import RuleSet
+
+        for dup in RuleSet(rules).annotate(self):
+            pass
+
+    def apply(self, dryrun=False, jobs=None, journal=None):
+        """Apply actions
+
+        Args:
+            - dryrun (bool): only log the actions
+            - jobs (int): if given, apply groups concurrently with this many
+              threads, batching deletions (see `executor.Executor`)
+            - journal (journal.Journal): record actions, skipping completed ones
+        """
+        if jobs is None:
+            for dup in self:
+                dup.apply(dryrun, journal)
+        else:
+            from .executor import Executor
+
+            with Executor(jobs=jobs, dryrun=dryrun, journal=journal) as executor:
+                for dup in self:
+                    executor.submit(dup)
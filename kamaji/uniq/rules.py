@@ -2,6 +2,54 @@ from .postfslint import ActionType
 import os
 import sys
 import re
+from itertools import chain
+
+# an inline flag group like (?i), which applies to the whole expression
+_global_flags = re.compile(r"\(\?[aiLmsux]+\)")
+
+
+class RegexRule(object):
+    """Rule marking UNKNOWN actions whose path matches a regular expression
+
+    The expression is compiled once, when the rule is created.
+    """
+
+    def __init__(self, pattern, newtype=ActionType.KEEP, flags=re.I):
+        self.pattern = (
+            pattern if hasattr(pattern, "search") else re.compile(pattern, flags)
+        )
+        self.newtype = newtype
+
+    def __call__(self, actions):
+        search = self.pattern.search
+        for action in actions:
+            if action.type == ActionType.UNKNOWN and search(action.path):
+                action.type = self.newtype
+        return True
+
+    def __repr__(self):
+        return "RegexRule({!r}, {})".format(self.pattern.pattern, self.newtype)
+
+    def mergeable(self, other):
+        """Whether two rules can be combined into one expression"""
+        return (
+            isinstance(other, RegexRule)
+            and self.newtype == other.newtype
+            and self.pattern.flags == other.pattern.flags
+            and isinstance(self.pattern.pattern, str)
+            and isinstance(other.pattern.pattern, str)
+            # group numbers would shift
+            and self.pattern.groups == 0
+            and other.pattern.groups == 0
+            # only allowed at the start of an expression
+            and not _global_flags.search(self.pattern.pattern)
+            and not _global_flags.search(other.pattern.pattern)
+        )
+
+    def merge(self, other):
+        """Combine with another rule setting the same ActionType"""
+        pattern = "(?:{})|(?:{})".format(self.pattern.pattern, other.pattern.pattern)
+        return RegexRule(re.compile(pattern, self.pattern.flags), self.newtype)
 
 
 def rule_re(pattern, newtype=ActionType.KEEP, flags=re.I):
@@ -16,43 +64,131 @@ def rule_re(pattern, newtype=ActionType.KEEP, flags=re.I):
         A rule function, which when evaluated on a list of rules KEEPs any paths matching the pattern
 
     """
+    return RegexRule(pattern, newtype, flags)
 
-    def rule(actions):
-        # compile regular expression
-        patt = pattern if hasattr("match", pattern) else re.compile(pattern, flags)
 
-        for action in actions:
-            if action.type == ActionType.UNKNOWN:
-                for action in actions:
-                    if action.type == ActionType.UNKNOWN and patt.search(action.path):
-                        action.type = newtype
-        return True
+class RuleSet(object):
+    """A list of rules, compiled for annotating many groups
 
-    return rule
+    Consecutive `RegexRule`s setting the same ActionType are merged into a single
+    expression. The regular expression rules at the start of the list are evaluated
+    for all paths of a batch of groups in one pass; remaining rules are then applied
+    to each group in order, as in `DupGroup.annotate`. The resulting annotations
+    are the same as applying the original rules to each group.
+
+    A RuleSet is itself a list of rules, so it can be passed to `DupGroup.annotate`.
+    """
+
+    def __init__(self, rules):
+        """
+        Args:
+            - rules (list of ([action] -> bool)): rules, see `DupGroup.annotate`
+        """
+        compiled = []
+        for rule in rules:
+            if isinstance(rule, RegexRule) and rule.newtype == ActionType.UNKNOWN:
+                continue  # no-op
+            if (
+                compiled
+                and isinstance(rule, RegexRule)
+                and rule.mergeable(compiled[-1])
+            ):
+                compiled[-1] = compiled[-1].merge(rule)
+            else:
+                compiled.append(rule)
+        self.rules = compiled
+        # leading regular expressions never stop annotation
+        n = 0
+        while n < len(compiled) and isinstance(compiled[n], RegexRule):
+            n += 1
+        self.regex = [(rule.pattern.search, rule.newtype) for rule in compiled[:n]]
+        self.remaining = compiled[n:]
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def annotate(self, groups, batch_size=1024):
+        """Annotate groups in batches
+
+        Args:
+            - groups (iterable of DupGroup): groups to annotate
+            - batch_size (int): number of groups evaluated together
+
+        Yields: each group, after annotation
+        """
+        batch = []
+        for group in groups:
+            batch.append(group)
+            if len(batch) >= batch_size:
+                yield from self.annotate_batch(batch)
+                batch = []
+        yield from self.annotate_batch(batch)
+
+    def annotate_batch(self, batch):
+        """Annotate a list of groups
+
+        Returns: batch, for chaining
+        """
+        unknown = ActionType.UNKNOWN
+        regex = self.regex
+        if regex:
+            for action in chain.from_iterable(batch):
+                if action.type == unknown:
+                    path = action.path
+                    for search, newtype in regex:
+                        if search(path):
+                            action.type = newtype
+                            break
+        remaining = self.remaining
+        if remaining:
+            for group in batch:
+                for rule in remaining:
+                    if not rule(group):
+                        break
+        return batch
 
 
 def rule_specificity(actions):
     """
     If one duplicate is in the parent directory of another, keep the deeper one.
+
+    Directories are sorted by their path components, which places each directory
+    directly before its subdirectories, so this takes O(n log n) time.
     """
-    dirnames = [os.path.dirname(a.path) for a in actions]
-    for i in range(len(actions) - 1):
-        for j in range(i + 1, len(actions)):
-            common = os.path.commonpath([dirnames[i], dirnames[j]])
-            if dirnames[i] != dirnames[j]:
-                if common == dirnames[i]:
-                    if actions[i].type == ActionType.UNKNOWN:
-                        actions[i].type = ActionType.DELETE
-                    # if actions[j].type == ActionType.UNKNOWN:
-                    #     actions[j].type = ActionType.KEEP
-                elif common == dirnames[j]:
-                    if actions[j].type == ActionType.UNKNOWN:
-                        actions[j].type = ActionType.DELETE
-                    # if actions[i].type == ActionType.UNKNOWN:
-                    #     actions[i].type = ActionType.KEEP
+    dirnames = {os.path.dirname(a.path) for a in actions}
+    if len(dirnames) < 2:
+        return True
+    keys = sorted((os.path.isabs(d), _components(d), d) for d in dirnames)
+    parents = set()
+    for i, (isabs, components, dirname) in enumerate(keys):
+        # Only directories in normal form are reported as a common path
+        if dirname != (os.sep if isabs else "") + os.sep.join(components):
+            continue
+        # Subdirectories (or other spellings of the same directory) come next
+        if i + 1 < len(keys):
+            nextabs, nextcomponents, _ = keys[i + 1]
+            if nextabs == isabs and nextcomponents[: len(components)] == components:
+                parents.add(dirname)
+                continue
+        if i > 0 and keys[i - 1][:2] == (isabs, components):
+            parents.add(dirname)
+    for action in actions:
+        if (
+            action.type == ActionType.UNKNOWN
+            and os.path.dirname(action.path) in parents
+        ):
+            action.type = ActionType.DELETE
     return True
 
 
+def _components(path):
+    """Split a path like os.path.commonpath does"""
+    return tuple(c for c in path.split(os.sep) if c and c != os.curdir)
+
+
 def rule_single(actions):
     """Keep last UNKNOWN duplicate"""
     unknown = None
@@ -0,0 +1,189 @@
+"""Find duplicate files without fslint
+
+Files are grouped by size, then by a hash of their first and last few KB. Only files
+which still collide are hashed in full. Hashing runs in a thread pool, since hashlib
+releases the GIL while digesting large reads.
+"""
+
+import hashlib
+import logging
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .postfslint import DupGroup
+from .. import stats
+
+# bytes hashed at each end of a file for the partial hash
+BLOCK = 4096
+# read size for full hashes
+CHUNK = 1 << 20
+
+
+def walk(paths: Iterable[str]) -> Iterator[Tuple[str, os.stat_result]]:
+    """Find regular files
+
+    Symbolic links are not followed. If several paths are hard links to the same
+    file, only the first one is listed.
+
+    Args:
+        - paths (list of str): files or directories to search
+
+    Yields: (path, stat) tuples
+    """
+    seen = set()
+    stack = list(reversed(list(paths)))
+    while stack:
+        path = stack.pop()
+        try:
+            st = os.stat(path, follow_symlinks=False)
+        except OSError as ex:
+            logging.warning(ex)
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            try:
+                with os.scandir(path) as entries:
+                    names = sorted(entry.path for entry in entries)
+            except OSError as ex:
+                logging.warning(ex)
+                continue
+            stack.extend(reversed(names))
+        elif stat.S_ISREG(st.st_mode):
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                yield path, st
+
+
+def partial_hash(path: str, size: int) -> bytes:
+    """Hash the first and last BLOCK bytes of a file
+
+    Files of up to 2*BLOCK bytes are hashed completely.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with stats.timer("scan.partial_hash"), open(path, "rb") as f:
+        h.update(f.read(BLOCK))
+        if size > BLOCK:
+            f.seek(max(BLOCK, size - BLOCK))
+            h.update(f.read(BLOCK))
+    stats.count("scan.bytes_read", min(size, 2 * BLOCK))
+    return h.digest()
+
+
+def full_hash(path: str) -> bytes:
+    """Hash a whole file"""
+    h = hashlib.blake2b(digest_size=16)
+    with stats.timer("scan.full_hash"), open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            h.update(chunk)
+        stats.count("scan.bytes_read", f.tell())
+    return h.digest()
+
+
+def _hashes(executor, func, args) -> Iterator[Tuple[tuple, Optional[bytes]]]:
+    """Apply a hash function in parallel, logging unreadable files"""
+
+    def safe(arg):
+        try:
+            return func(*arg)
+        except OSError as ex:
+            logging.warning(ex)
+            return None
+
+    return zip(args, executor.map(safe, args))
+
+
+def find_duplicates(
+    paths: Iterable[str], jobs: int = 4, minsize: int = 1, index=None
+) -> Iterator[DupGroup]:
+    """Find groups of files with identical content
+
+    Args:
+        - paths (list of str): files or directories to search
+        - jobs (int): number of hashing threads
+        - minsize (int): ignore files smaller than this
+        - index (HashIndex): if given, reuse hashes of unchanged files and store new
+          ones. A new run is started in the index.
+
+    Yields: DupGroup of UNKNOWN actions, largest files first
+    """
+    paths = list(paths)
+    if index is not None:
+        index.begin()
+
+    bysize: Dict[int, List[str]] = {}
+    # (partial, full) hashes from the index
+    cached: Dict[str, Tuple[Optional[bytes], Optional[bytes]]] = {}
+    for path, st in walk(paths):
+        if index is not None:
+            hashes = index.update(path, st)
+            if hashes != (None, None):
+                cached[path] = hashes
+        if st.st_size >= minsize:
+            bysize.setdefault(st.st_size, []).append(path)
+    if index is not None:
+        index.prune(paths)
+
+    candidates = [
+        (path, size)
+        for size in sorted(bysize, reverse=True)
+        if len(bysize[size]) > 1
+        for path in bysize[size]
+    ]
+    del bysize
+
+    with ThreadPoolExecutor(jobs) as executor:
+        # group by size and partial hash
+        bypartial: Dict[Tuple[int, bytes], List[str]] = {}
+        todo = []
+        for path, size in candidates:
+            partial = cached.get(path, (None, None))[0]
+            if partial is None:
+                todo.append((path, size))
+            else:
+                bypartial.setdefault((size, partial), []).append(path)
+        for (path, size), digest in _hashes(executor, partial_hash, todo):
+            if digest is not None:
+                bypartial.setdefault((size, digest), []).append(path)
+                if index is not None:
+                    # the partial hash covers small files completely
+                    full = digest if size <= 2 * BLOCK else None
+                    index.set_hashes(path, partial=digest, full=full)
+        del candidates, todo
+
+        # hash colliding files completely, unless the partial hash covered them
+        complete = []
+        collisions = []
+        for (size, digest), group in bypartial.items():
+            if len(group) > 1:
+                if size <= 2 * BLOCK:
+                    complete.append(group)
+                else:
+                    collisions.extend((path, size) for path in group)
+        del bypartial
+
+        byfull: Dict[Tuple[int, bytes], List[str]] = {}
+        todo = []
+        for path, size in collisions:
+            full = cached.get(path, (None, None))[1]
+            if full is None:
+                todo.append((path, size))
+            else:
+                byfull.setdefault((size, full), []).append(path)
+        for (path, size), digest in _hashes(
+            executor, lambda path, size: full_hash(path), todo
+        ):
+            if digest is not None:
+                byfull.setdefault((size, digest), []).append(path)
+                if index is not None:
+                    index.set_hashes(path, full=digest)
+        if index is not None:
+            index.commit()
+
+        for (size, digest), group in sorted(byfull.items(), key=lambda i: -i[0][0]):
+            if len(group) > 1:
+                yield DupGroup(paths=group)
+
+    # small files, which the partial hash covered completely
+    for group in complete:
+        yield DupGroup(paths=group)
@@ -0,0 +1,197 @@
+"""Find visually similar images
+
+Re-exported, resized or re-compressed copies of a photo differ in content, so
+`scan.find_duplicates` misses them. Here each image is reduced to a 64-bit
+difference hash (dHash), which changes little under such edits, and images whose
+hashes differ in at most `distance` bits are grouped.
+
+Hashing decodes images, so it runs in a process pool. JPEGs are decoded at reduced
+scale, which makes them much cheaper. Near hashes are found with a multi-index
+lookup rather than by comparing all pairs. The hash is split into m segments, where
+m is about half the distance. If two hashes are within the distance, at least one
+of their segments differs in at most one bit (pigeonhole principle). Each segment
+is indexed in a table, and only hashes found by probing the tables with the
+segment and its one-bit variants are compared. Images are then clustered
+transitively with union-find.
+
+Requires Pillow (`pip install kamaji[similar]`).
+"""
+
+import importlib.util
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .postfslint import DupGroup
+from .scan import walk
+
+# bits per side of the dHash grid; hashes have HASH_SIZE**2 bits
+HASH_SIZE = 8
+# file types hashed
+image_ext = {".jpg", ".jpeg", ".png", ".gif", ".tif", ".tiff", ".bmp", ".webp"}
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # python < 3.10
+
+    def popcount(x: int) -> int:
+        return bin(x).count("1")
+
+
+def available() -> bool:
+    """Whether Pillow is installed, without importing it"""
+    return importlib.util.find_spec("PIL") is not None
+
+
+def dhash(path: str, size: int = HASH_SIZE) -> int:
+    """Difference hash of an image
+
+    The image is converted to grayscale and shrunk to (size + 1) x size pixels.
+    Each bit records whether a pixel is darker than its right neighbour.
+
+    Raises:
+        - OSError: the file could not be read or decoded
+    """
+    # imported here, as Pillow is optional and slow to import
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as img:
+        # let the JPEG decoder scale down
+        img.draft("L", (4 * size, 4 * size))
+        img = ImageOps.exif_transpose(img).convert("L")
+        pixels = list(img.resize((size + 1, size), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(size):
+        start = row * (size + 1)
+        for left, right in zip(
+            pixels[start : start + size], pixels[start + 1 : start + size + 1]
+        ):
+            value = value << 1 | (left < right)
+    return value
+
+
+def _hash(path: str) -> Tuple[str, Optional[int], Optional[str]]:
+    """dhash for the process pool, returning errors instead of raising them"""
+    try:
+        return path, dhash(path), None
+    except Exception as ex:  # Pillow raises various errors for bad files
+        return path, None, "{}: {}".format(path, ex)
+
+
+class UnionFind(object):
+    """Disjoint sets of the integers 0 to n-1"""
+
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, i: int) -> int:
+        parent = self.parent
+        while parent[i] != i:
+            # path halving
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i: int, j: int):
+        i, j = self.find(i), self.find(j)
+        if i == j:
+            return
+        if self.size[i] < self.size[j]:
+            i, j = j, i
+        self.parent[j] = i
+        self.size[i] += self.size[j]
+
+
+def _segments(bits: int, n: int) -> List[Tuple[int, int, List[int]]]:
+    """Split `bits` bits into n segments of nearly equal width
+
+    Returns: (shift, mask, single-bit flips) for each segment
+    """
+    segments = []
+    shift = 0
+    for k in range(n):
+        width = bits // n + (1 if k < bits % n else 0)
+        flips = [1 << b for b in range(width)]
+        segments.append((shift, (1 << width) - 1, flips))
+        shift += width
+    return segments
+
+
+def cluster(hashes: List[int], distance: int, bits: int = HASH_SIZE**2) -> UnionFind:
+    """Join hashes which differ in at most `distance` bits
+
+    Returns: UnionFind over the indices of `hashes`
+    """
+    sets = UnionFind(len(hashes))
+    # some segment is within floor(distance / n) <= 1 bits
+    n = min(distance // 2 + 1, bits)
+    segments = _segments(bits, n)
+    exact = distance < n
+    # one table per segment: segment value -> indices of hashes
+    tables: List[Dict[int, List[int]]] = [{} for s in segments]
+    for i, h in enumerate(hashes):
+        found = []
+        for table, (shift, mask, flips) in zip(tables, segments):
+            key = (h >> shift) & mask
+            get = table.get
+            found.append(get(key, ()))
+            if not exact:
+                found.extend([get(key ^ flip, ()) for flip in flips])
+            table.setdefault(key, []).append(i)
+        candidates = set(chain.from_iterable(found))
+        candidates.discard(i)
+        for j in candidates:
+            if popcount(h ^ hashes[j]) <= distance:
+                sets.union(i, j)
+    return sets
+
+
+def find_similar(
+    paths: Iterable[str], distance: int = 4, jobs: Optional[int] = None
+) -> Iterator[DupGroup]:
+    """Find groups of visually similar images
+
+    Args:
+        - paths (list of str): files or directories to search
+        - distance (int): maximum number of differing hash bits (out of 64)
+        - jobs (int): number of hashing processes (default: number of CPUs)
+
+    Yields: DupGroup of UNKNOWN actions, largest groups first
+
+    Raises:
+        - RuntimeError: Pillow is not installed
+    """
+    if not available():
+        raise RuntimeError(
+            "Pillow is required to find similar images (pip install kamaji[similar])"
+        )
+    files = [
+        path
+        for path, st in walk(paths)
+        if os.path.splitext(path)[1].lower() in image_ext
+    ]
+    logging.info("Hashing %d images", len(files))
+
+    # identical hashes are clustered directly
+    byhash: Dict[int, List[str]] = {}
+    with ProcessPoolExecutor(jobs) as executor:
+        for path, value, error in executor.map(_hash, files, chunksize=64):
+            if error is not None:
+                logging.warning(error)
+            else:
+                byhash.setdefault(value, []).append(path)
+    del files
+
+    hashes = list(byhash)
+    sets = cluster(hashes, distance)
+    clusters: Dict[int, List[str]] = {}
+    for i, h in enumerate(hashes):
+        clusters.setdefault(sets.find(i), []).extend(byhash[h])
+    del byhash, hashes, sets
+
+    for group in sorted(clusters.values(), key=len, reverse=True):
+        if len(group) > 1:
+            yield DupGroup(paths=group)
@@ -0,0 +1,201 @@
+"""Compact storage for many groups of actions
+
+A `GroupStore` keeps all actions of all groups in a few flat columns instead of one
+`Action` object (plus path string and argument tuple) per file:
+
+- directory prefixes, stored once each in a `StringTable` and referenced by index
+- file names, UTF-8 encoded into a single buffer with an array of end offsets
+- action types, one byte per action
+- arguments, only for the few actions that have any (e.g. RENAME)
+- group boundaries, as offsets into the action columns
+
+This takes roughly a tenth of the memory of a list of `DupGroup`s. Groups and
+actions are read and annotated through `GroupView` and `ActionView`, which behave
+like `DupGroup` and `Action`, so rules work on them unchanged.
+"""
+
+import os
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, List
+
+from .postfslint import Action, ActionType, DupGroup
+
+# byte code of each ActionType in the types column: its TSV code, as a byte
+_codes = {t: ord(t.value) for t in ActionType}
+_types = {code: t for t, code in _codes.items()}
+
+
+class StringTable(object):
+    """Strings stored once and identified by their index"""
+
+    __slots__ = ("strings", "ids")
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    def add(self, s: str) -> int:
+        """Returns: the index of s, adding it if necessary"""
+        i = self.ids.get(s)
+        if i is None:
+            i = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def __getitem__(self, i: int) -> str:
+        return self.strings[i]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class GroupStore(object):
+    """Column-oriented list of groups of actions
+
+    Supports the list operations used by `DupList`: `append`, `extend`, `len`,
+    indexing and iteration. Items are `GroupView`s; changing the type of one of
+    their actions updates the store.
+    """
+
+    def __init__(self, groups: Iterable = ()):
+        """
+        Args:
+            - groups (iterable of DupGroup): initial groups
+        """
+        self.prefixes = StringTable()
+        self.prefix = array("I")
+        self.names = bytearray()
+        self.name_ends = array("Q")
+        self.types = bytearray()
+        self.args: Dict[int, tuple] = {}
+        # group i holds actions offsets[i] to offsets[i + 1]
+        self.offsets = array("Q", [0])
+        self.extend(groups)
+
+    def append(self, group: Iterable[Action]):
+        """Add a group of actions"""
+        addprefix = self.prefixes.add
+        sep = os.sep
+        for action in group:
+            path = action.path
+            i = path.rfind(sep) + 1
+            self.prefix.append(addprefix(path[:i]))
+            self.names += path[i:].encode("utf-8", "surrogateescape")
+            self.name_ends.append(len(self.names))
+            if action.args:
+                self.args[len(self.types)] = tuple(action.args)
+            self.types.append(_codes[action.type])
+        self.offsets.append(len(self.types))
+
+    def extend(self, groups: Iterable[Iterable[Action]]):
+        for group in groups:
+            self.append(group)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("group index out of range")
+        return GroupView(self, self.offsets[i], self.offsets[i + 1])
+
+    def __iter__(self) -> Iterator["GroupView"]:
+        offsets = self.offsets
+        for i in range(len(offsets) - 1):
+            yield GroupView(self, offsets[i], offsets[i + 1])
+
+    def path(self, i: int) -> str:
+        """Path of the i-th action"""
+        start = self.name_ends[i - 1] if i else 0
+        name = self.names[start : self.name_ends[i]].decode("utf-8", "surrogateescape")
+        return self.prefixes[self.prefix[i]] + name
+
+    def arguments(self, i: int) -> tuple:
+        """Arguments of the i-th action"""
+        return self.args.get(i, ())
+
+    def actions(self) -> int:
+        """Total number of actions"""
+        return len(self.types)
+
+
+class ActionView(Action):
+    """An action stored in a GroupStore
+
+    Behaves like an `Action`; setting `type` updates the store.
+    """
+
+    __slots__ = ("store", "index")
+
+    def __init__(self, store: GroupStore, index: int):
+        self.store = store
+        self.index = index
+
+    @property
+    def type(self) -> ActionType:
+        return _types[self.store.types[self.index]]
+
+    @type.setter
+    def type(self, actiontype):
+        self.store.types[self.index] = _codes[ActionType(actiontype)]
+
+    @property
+    def path(self) -> str:
+        return self.store.path(self.index)
+
+    @property
+    def args(self) -> tuple:
+        return self.store.arguments(self.index)
+
+    def __repr__(self):
+        return "ActionView({!r})".format(str(self))
+
+
+class GroupView(Sequence):
+    """A group of actions stored in a GroupStore
+
+    Provides the read-only list interface and the helpers of `DupGroup`.
+    """
+
+    __slots__ = ("store", "start", "stop")
+
+    def __init__(self, store: GroupStore, start: int, stop: int):
+        self.store = store
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("action index out of range")
+        return ActionView(self.store, self.start + i)
+
+    def __iter__(self) -> Iterator[ActionView]:
+        store = self.store
+        for i in range(self.start, self.stop):
+            yield ActionView(store, i)
+
+    def __eq__(self, other):
+        if not isinstance(other, (GroupView, DupGroup)):
+            return NotImplemented
+        return [str(a) for a in self] == [str(a) for a in other]
+
+    def __repr__(self):
+        return "GroupView({!r})".format(list(self))
+
+    annotate = DupGroup.annotate
+    annotation = DupGroup.annotation
+    paths = DupGroup.paths
+    __str__ = DupGroup.__str__
+    apply = DupGroup.apply
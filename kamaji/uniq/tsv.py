@@ -0,0 +1,125 @@
+"""Streaming reader and writer for TSV action files
+
+The format is described in `DupList.read_tsv`: one action per line (type code,
+path and arguments separated by tabs), groups separated by blank lines, and lines
+starting with `#` ignored.
+
+Input is read in large chunks and split into lines in bulk. Actions are built
+directly from their fields, after checking the type code and the number of
+arguments, rather than through `Action.__init__`. Output is collected into
+buffers of about `buffer_size` characters, so writing takes few calls without
+holding the whole file in memory.
+"""
+
+import logging
+from typing import Iterable, Iterator, TextIO
+
+from .postfslint import Action, ActionType, DupGroup, nargs
+
+# characters read at once
+CHUNK = 1 << 20
+# characters written at once. Small enough for output to start promptly.
+BUFFER = 1 << 16
+
+# type code -> (ActionType, number of arguments)
+_codes = {t.value: (t, nargs.get(t, 0)) for t in ActionType}
+
+
+def _lines(tsv: TextIO, chunk_size: int) -> Iterator[str]:
+    """Lines of a file, without line endings, read in chunks"""
+    rest = ""
+    while True:
+        chunk = tsv.read(chunk_size)
+        if not chunk:
+            break
+        lines = (rest + chunk).split("\n")
+        rest = lines.pop()
+        yield from lines
+    if rest:
+        yield rest
+
+
+def _group(actions: list) -> DupGroup:
+    """Wrap a list of actions in a DupGroup without copying it"""
+    group = DupGroup.__new__(DupGroup)
+    group.data = actions
+    return group
+
+
+def iter_groups(tsv: TextIO, chunk_size: int = CHUNK) -> Iterator[DupGroup]:
+    """Read groups from a TSV action file
+
+    Lines which can't be parsed are logged and skipped.
+
+    Args:
+        - tsv (file-like): file opened in text mode
+        - chunk_size (int): number of characters read at once
+
+    Yields: DupGroup
+    """
+    codes = _codes
+    new = Action.__new__
+    actions = []
+    for linenum, line in enumerate(_lines(tsv, chunk_size)):
+        if not line:
+            # start new group
+            if actions:
+                yield _group(actions)
+                actions = []
+            continue
+        if line[0] == "#":
+            continue
+        fields = line.split("\t")
+        code = codes.get(fields[0])
+        if code is None or len(fields) != code[1] + 2:
+            # let Action explain the problem
+            error = "Invalid action"
+            try:
+                Action(*fields)
+            except (TypeError, ValueError) as ex:
+                error = ex
+            logging.error("Parse error line {}: {}".format(linenum, error))
+            continue
+        action = new(Action)
+        action.type = code[0]
+        action.path = fields[1]
+        action.args = tuple(fields[2:]) if code[1] else ()
+        actions.append(action)
+    if actions:
+        yield _group(actions)
+
+
+def write_groups(
+    outfile: TextIO, groups: Iterable, header: str = "", buffer_size: int = BUFFER
+):
+    """Write groups as they are produced
+
+    Groups are separated by blank lines. No newline follows the last group.
+
+    Args:
+        - outfile (file-like): output file
+        - groups (iterable of DupGroup): groups to write
+        - header (str): text written first
+        - buffer_size (int): approximate number of characters written at once
+    """
+    buf = [header]
+    size = len(header)
+    sep = ""
+    for group in groups:
+        for action in group:
+            args = action.args
+            if args:
+                line = "\t".join((action.type._value_, action.path) + tuple(args))
+            else:
+                # _value_ is much faster than the value property
+                line = action.type._value_ + "\t" + action.path
+            buf.append(sep)
+            buf.append(line)
+            size += len(line) + 1
+            sep = "\n"
+        sep = "\n\n"
+        if size >= buffer_size:
+            outfile.write("".join(buf))
+            buf = []
+            size = 0
+    outfile.write("".join(buf))
@@ -45,6 +45,7 @@ setup(
     keywords="photo organization directory management duplicates utility deduplication",
     packages=find_packages(exclude=["contrib", "docs", "tests"]),
     install_requires=["click >= 7"],
+    extras_require={"similar": ["Pillow >= 6"]},
     setup_requires=["pytest-runner >= 2"],
     tests_require=["pytest >= 3", "tox >= 3", "flake8 >= 3"],
     python_requires=">=3.6",
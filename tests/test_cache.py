@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from kamaji.sort import cache as cache_
+from kamaji.sort.cache import MetadataCache
+
+DATES = {("2019", "03"), ("2019", "04")}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.time for the cache"""
+    now = [1000000.0]
+    monkeypatch.setattr(cache_.time, "time", lambda: now[0])
+    return now
+
+
+def photo(tmp_path, name, content="photo"):
+    path = tmp_path / name
+    path.write_text(content)
+    return str(path)
+
+
+def test_hit(tmp_path):
+    img = photo(tmp_path, "IMG_1.JPG")
+    with MetadataCache(str(tmp_path / "cache.sqlite")) as cache:
+        assert cache.get(img, os.stat(img)) is None
+        cache.put(img, os.stat(img), DATES)
+        cache.put(photo(tmp_path, "IMG_2.JPG"), os.stat(img), set())
+        assert cache.get(img, os.stat(img)) == DATES
+        assert cache.get(str(tmp_path / "IMG_2.JPG"), os.stat(img)) == set()
+        assert (cache.hits, cache.misses) == (2, 1)
+    # persisted, and keyed by absolute path
+    with MetadataCache(str(tmp_path / "cache.sqlite")) as cache:
+        assert cache.get(os.path.relpath(img), os.stat(img)) == DATES
+
+
+def test_miss_after_change(tmp_path):
+    img = photo(tmp_path, "IMG_1.JPG")
+    with MetadataCache(str(tmp_path / "cache.sqlite")) as cache:
+        cache.put(img, os.stat(img), DATES)
+        st = os.stat(img)
+        os.utime(img, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+        assert cache.get(img, os.stat(img)) is None
+        cache.put(img, os.stat(img), DATES)
+        with open(img, "a") as f:
+            f.write("more")
+        os.utime(img, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+        assert cache.get(img, os.stat(img)) is None
+        assert cache.misses == 2
+
+
+def test_evict_least_recently_used(tmp_path, clock):
+    imgs = [photo(tmp_path, "IMG_%d.JPG" % i) for i in range(4)]
+    cache = MetadataCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    for img in imgs:
+        cache.put(img, os.stat(img), DATES)
+        clock[0] += 1
+    # using the first entry keeps it
+    assert cache.get(imgs[0], os.stat(imgs[0])) == DATES
+    cache.close()
+    cache = MetadataCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    assert [cache.get(img, os.stat(img)) is not None for img in imgs] == [
+        True,
+        False,
+        False,
+        True,
+    ]
+    cache.close()
+
+
+def test_evict_old(tmp_path, clock):
+    old, new = photo(tmp_path, "IMG_1.JPG"), photo(tmp_path, "IMG_2.JPG")
+    cache = MetadataCache(str(tmp_path / "cache.sqlite"), max_age=60)
+    cache.put(old, os.stat(old), DATES)
+    clock[0] += 61
+    cache.put(new, os.stat(new), DATES)
+    assert cache.evict() == 1
+    assert cache.get(old, os.stat(old)) is None
+    assert cache.get(new, os.stat(new)) == DATES
+    cache.close()
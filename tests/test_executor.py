@@ -0,0 +1,100 @@
+import pytest
+
+from kamaji.aio import AsyncFS
+from kamaji.uniq import postfslint
+from kamaji.uniq.executor import AsyncExecutor, Executor
+from kamaji.uniq.postfslint import Action, ActionType, DupGroup
+
+
+@pytest.fixture(autouse=True)
+def no_trash(monkeypatch):
+    # delete files rather than depending on whether `trash` is installed
+    monkeypatch.setattr(postfslint, "trash_command", lambda: None)
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def apply(groups, jobs=1, asyncio=False, **kwargs):
+    if asyncio:
+        fs = AsyncFS(limit=jobs)
+        executor = AsyncExecutor(fs, **kwargs)
+    else:
+        fs = None
+        executor = Executor(jobs=jobs, **kwargs)
+    with executor:
+        for group in groups:
+            executor.submit(group)
+    if fs is not None:
+        fs.close()
+    return executor
+
+
+executors = pytest.mark.parametrize(
+    "jobs,asyncio", [(1, False), (4, False), (4, True)], ids=["1", "4", "async"]
+)
+
+
+@executors
+def test_delete_then_rename_onto_it(tmp_path, jobs, asyncio):
+    x, y = tmp_path / "x" / "IMG.jpg", tmp_path / "y" / "IMG.jpg"
+    write(x, "x")
+    write(y, "y")
+    group = DupGroup(
+        [
+            Action(ActionType.DELETE, str(x)),
+            Action(ActionType.RENAME, str(y), str(x)),
+        ]
+    )
+    executor = apply([group], jobs=jobs, asyncio=asyncio)
+    assert x.read_text() == "y"
+    assert not y.exists()
+    assert (executor.done, executor.failed) == (2, 0)
+
+
+@executors
+def test_actions_run_in_group_order(tmp_path, jobs, asyncio):
+    a, b, c = (tmp_path / name for name in "abc")
+    write(a, "a")
+    write(b, "b")
+    # a -> c, then b -> a: only correct if the renames run in order
+    group = DupGroup(
+        [
+            Action(ActionType.RENAME, str(a), str(c)),
+            Action(ActionType.RENAME, str(b), str(a)),
+        ]
+    )
+    apply([group], jobs=jobs, asyncio=asyncio)
+    assert a.read_text() == "b"
+    assert c.read_text() == "a"
+    assert not b.exists()
+
+
+@executors
+def test_delete_only_groups_are_batched(tmp_path, jobs, asyncio):
+    groups = []
+    for i in range(10):
+        keep, dup = tmp_path / "k{}".format(i), tmp_path / "d{}".format(i)
+        write(keep, str(i))
+        write(dup, str(i))
+        groups.append(
+            DupGroup(
+                [
+                    Action(ActionType.KEEP, str(keep)),
+                    Action(ActionType.DELETE, str(dup)),
+                ]
+            )
+        )
+    executor = apply(groups, jobs=jobs, asyncio=asyncio, batch_size=4)
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        "k{}".format(i) for i in range(10)
+    )
+    assert (executor.done, executor.failed) == (10, 0)
+
+
+def test_missing_file_is_counted_as_failed(tmp_path):
+    group = DupGroup([Action(ActionType.DELETE, str(tmp_path / "missing"))])
+    executor = apply([group])
+    assert (executor.done, executor.failed) == (0, 1)
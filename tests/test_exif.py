@@ -0,0 +1,77 @@
+import struct
+
+import pytest
+
+from kamaji.sort import exif
+
+DATE = "2019:05:01 12:00:00"
+
+
+def tiff(date, endian=">", cr2=False):
+    """A TIFF file with CreateDate and DateTimeOriginal set to date"""
+    value = date.encode("ascii") + b"\0"
+    ifd0 = 16 if cr2 else 8
+    exififd = ifd0 + 2 + 12 + 4
+    data = exififd + 2 + 2 * 12 + 4
+    header = (b"II*\0" if endian == "<" else b"MM\0*") + struct.pack(endian + "I", ifd0)
+    if cr2:
+        header += b"CR\x02\x00" + struct.pack(endian + "I", 0)
+    return b"".join(
+        (
+            header,
+            # IFD0, pointing to the EXIF IFD
+            struct.pack(endian + "H", 1),
+            struct.pack(endian + "HHII", 0x8769, 4, 1, exififd),
+            struct.pack(endian + "I", 0),
+            # EXIF IFD with DateTimeOriginal and CreateDate
+            struct.pack(endian + "H", 2),
+            struct.pack(endian + "HHII", 0x9003, 2, len(value), data),
+            struct.pack(endian + "HHII", 0x9004, 2, len(value), data + len(value)),
+            struct.pack(endian + "I", 0),
+            value,
+            value,
+        )
+    )
+
+
+def jpeg(date):
+    """A JPEG file with an EXIF segment"""
+    app1 = b"Exif\0\0" + tiff(date, "<")
+    return b"".join(
+        (
+            b"\xff\xd8\xff\xe1",
+            struct.pack(">H", len(app1) + 2),
+            app1,
+            b"\xff\xda\x00\x02",
+            b"\x00" * 64,
+            b"\xff\xd9",
+        )
+    )
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        jpeg(DATE),
+        tiff(DATE, "<"),
+        tiff(DATE, ">"),
+        tiff(DATE, "<", cr2=True),
+        tiff(DATE, ">", cr2=True),
+    ],
+    ids=["jpeg", "tiff-le", "tiff-be", "cr2-le", "cr2-be"],
+)
+def test_read_dates(tmp_path, data):
+    path = tmp_path / "photo"
+    path.write_bytes(data)
+    assert exif.read_dates(str(path)) == {("2019", "05")}
+
+
+@pytest.mark.parametrize(
+    "data",
+    [b"", b"not an image", jpeg(DATE)[:30], b"\xff\xd8\xff\xda\x00\x02\xff\xd9"],
+    ids=["empty", "unknown", "truncated", "no dates"],
+)
+def test_unreadable_files(tmp_path, data):
+    path = tmp_path / "photo"
+    path.write_bytes(data)
+    assert exif.read_dates(str(path)) is None
@@ -0,0 +1,37 @@
+import io
+
+import pytest
+
+from kamaji.uniq.postfslint import DupList
+
+TOP = "/top/a\n/top/b\n\n/top/c\n/top/d\n"
+OTHER = "-----Other section\n/x\n"
+DUPS = "-----DUPlicate files\n/d/a\n/d/b\n\n/d/c\n/d/d\n"
+
+
+def paths(groups):
+    return [[action.path for action in group] for group in groups]
+
+
+class Pipe(io.StringIO):
+    def seekable(self):
+        return False
+
+
+@pytest.mark.parametrize(
+    "report",
+    [TOP, TOP + OTHER, TOP + OTHER + DUPS, DUPS, OTHER + DUPS + OTHER],
+    ids=["findup", "no-dups", "top-and-dups", "dups", "sections"],
+)
+def test_matches_parse_fslint(report):
+    expected = DupList.fslint_duplist(DupList.parse_fslint(io.StringIO(report)))
+    assert paths(DupList.iter_fslint(io.StringIO(report))) == paths(expected)
+
+
+def test_unseekable_reports_stream_the_top_section(caplog):
+    groups = paths(DupList.iter_fslint(Pipe(TOP + DUPS)))
+    assert groups == [["/top/a", "/top/b"], ["/top/c", "/top/d"]] + [
+        ["/d/a", "/d/b"],
+        ["/d/c", "/d/d"],
+    ]
+    assert "Using the lines before" in caplog.text
@@ -0,0 +1,72 @@
+import os
+
+from kamaji.uniq.index import HashIndex
+from kamaji.uniq.scan import find_duplicates
+
+
+def write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def paths(groups):
+    return [sorted(a.path for a in group) for group in groups]
+
+
+def scan(index, roots):
+    groups = list(find_duplicates(roots, index=index))
+    index.commit()
+    return groups
+
+
+def test_lookup(tmp_path):
+    a = write(tmp_path / "d" / "a", b"abc")
+    b = write(tmp_path / "d" / "b", b"abc")
+    with HashIndex(str(tmp_path / "index.sqlite")) as index:
+        scan(index, [str(tmp_path / "d")])
+        assert index.lookup(a, os.stat(a)) == index.lookup(b, os.stat(b))
+        assert index.lookup(a, os.stat(a)) is not None
+
+
+def test_changed_files_are_stale(tmp_path):
+    a = write(tmp_path / "d" / "a", b"abc")
+    b = write(tmp_path / "d" / "b", b"abc")
+    with HashIndex(str(tmp_path / "index.sqlite")) as index:
+        scan(index, [str(tmp_path / "d")])
+        st = os.stat(a)
+        os.utime(a, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        assert index.lookup(a, os.stat(a)) is None
+        assert index.update(a, os.stat(a)) == (None, None)
+        write(tmp_path / "d" / "b", b"abcd")
+        assert index.lookup(b, os.stat(b)) is None
+        assert index.update(b, os.stat(b)) == (None, None)
+
+
+def test_under_does_not_match_prefixes(tmp_path):
+    b = [write(tmp_path / "a" / "b" / name, b"abc") for name in "xy"]
+    bc = [write(tmp_path / "a" / "bc" / name, b"abc") for name in "xy"]
+    with HashIndex(str(tmp_path / "index.sqlite")) as index:
+        scan(index, [str(tmp_path / "a")])
+        assert paths(index.duplicates([str(tmp_path / "a" / "b")])) == [b]
+        assert paths(index.duplicates([str(tmp_path / "a" / "bc")])) == [bc]
+        assert paths(index.duplicates([str(tmp_path / "a" / "b" / "x")])) == []
+        # pruning a/b keeps the files in a/bc
+        for path in b:
+            os.unlink(path)
+        scan(index, [str(tmp_path / "a" / "b")])
+        assert paths(index.duplicates()) == [bc]
+
+
+def test_new_only(tmp_path):
+    old = [write(tmp_path / name, b"old") for name in "ab"]
+    new = [write(tmp_path / name, b"new!") for name in "xy"]
+    with HashIndex(str(tmp_path / "index.sqlite")) as index:
+        groups = scan(index, [str(tmp_path)])
+        assert all(index.gained(group) for group in groups)
+        new.append(write(tmp_path / "z", b"new!"))
+        groups = scan(index, [str(tmp_path)])
+        assert paths(groups) == [new, old]
+        assert [index.gained(group) for group in groups] == [True, False]
+        assert paths(index.duplicates(new_only=True)) == [new]
+        assert paths(index.duplicates()) == [new, old]
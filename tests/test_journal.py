@@ -0,0 +1,69 @@
+from kamaji.journal import DELETE, MOVE, Journal
+
+
+def move(journal, src, dst):
+    journal.plan(MOVE, str(src), str(dst))
+    src.rename(dst)
+    journal.done(MOVE, str(src), str(dst))
+
+
+def test_resume_skips_completed(tmp_path):
+    path = str(tmp_path / "run.journal")
+    with Journal(path) as j:
+        j.plan(DELETE, "/a")
+        j.done(DELETE, "/a")
+        j.plan(DELETE, "/b")
+    with Journal(path, resume=True) as j:
+        assert j.is_done(DELETE, "/a")
+        assert not j.is_done(DELETE, "/b")
+
+
+def test_reopening_appends(tmp_path):
+    path = str(tmp_path / "run.journal")
+    a, b, c = (tmp_path / name for name in "abc")
+    a.write_text("a")
+    with Journal(path) as j:
+        move(j, a, b)
+    # a second run without --resume doesn't skip anything, nor lose the first
+    with Journal(path) as j:
+        assert not j.is_done(MOVE, str(a), str(b))
+        move(j, b, c)
+    with Journal(path, resume=True) as j:
+        assert j.rollback() == 2
+    assert a.read_text() == "a"
+    assert not b.exists() and not c.exists()
+
+
+def test_rollback_moves(tmp_path):
+    path = str(tmp_path / "run.journal")
+    src, dst = tmp_path / "src" / "a.jpg", tmp_path / "dst" / "a.jpg"
+    dst.parent.mkdir()
+    (tmp_path / "b.jpg").write_text("b")
+    with Journal(path) as j:
+        move(j, tmp_path / "b.jpg", tmp_path / "c.jpg")
+        # interrupted: planned but never done
+        j.plan(MOVE, str(tmp_path / "c.jpg"), str(tmp_path / "d.jpg"))
+        src.parent.mkdir()
+        src.write_text("a")
+        move(j, src, dst)
+        src.parent.rmdir()
+    with Journal(path, resume=True) as j:
+        assert j.rollback() == 2
+        # rolling back again finds nothing to undo
+        assert j.rollback() == 0
+    assert src.read_text() == "a"
+    assert (tmp_path / "b.jpg").read_text() == "b"
+    assert not dst.exists() and not (tmp_path / "c.jpg").exists()
+
+
+def test_rollback_refuses_to_overwrite(tmp_path):
+    path = str(tmp_path / "run.journal")
+    a, b = tmp_path / "a", tmp_path / "b"
+    a.write_text("a")
+    with Journal(path) as j:
+        move(j, a, b)
+    a.write_text("new")
+    with Journal(path, resume=True) as j:
+        assert j.rollback() == 0
+    assert a.read_text() == "new"
+    assert b.read_text() == "a"
@@ -0,0 +1,95 @@
+import errno
+import os
+
+import pytest
+
+from kamaji.uniq import link
+
+
+def files(tmp_path, path="photo.jpg", kept="kept.jpg", content="same"):
+    path, kept = tmp_path / path, tmp_path / kept
+    path.write_text(content)
+    kept.write_text("same")
+    return path, kept
+
+
+def leftovers(tmp_path):
+    return [p.name for p in tmp_path.iterdir() if p.name.endswith(".kamaji")]
+
+
+def test_same_content(tmp_path):
+    path, kept = files(tmp_path)
+    assert link.same_content(str(path), str(kept))
+    path.write_text("diff")
+    assert not link.same_content(str(path), str(kept))
+    path.write_text("different size")
+    assert not link.same_content(str(path), str(kept))
+
+
+def test_same_content_uses_index(tmp_path):
+    class Index:
+        def lookup(self, path, st):
+            return b"digest"
+
+    path, kept = files(tmp_path, content="diff")
+    # cached hashes are trusted over the (here different) content
+    assert link.same_content(str(path), str(kept), Index())
+
+
+@pytest.mark.parametrize("clone", [False, True], ids=["link", "clone"])
+def test_refuses_different_content(tmp_path, clone):
+    path, kept = files(tmp_path, content="diff")
+    with pytest.raises(IOError, match="content differs"):
+        link.replace(str(path), str(kept), clone=clone)
+    assert path.read_text() == "diff"
+    assert os.stat(str(path)).st_ino != os.stat(str(kept)).st_ino
+    assert leftovers(tmp_path) == []
+
+
+def test_hard_link(tmp_path):
+    path, kept = files(tmp_path)
+    assert link.replace(str(path), str(kept))
+    assert path.read_text() == "same"
+    assert os.stat(str(path)).st_ino == os.stat(str(kept)).st_ino
+    assert leftovers(tmp_path) == []
+    # replacing again is a no-op
+    assert link.replace(str(path), str(kept))
+
+
+def test_clone(tmp_path):
+    path, kept = files(tmp_path)
+    try:
+        link.replace(str(path), str(kept), clone=True)
+    except OSError as ex:
+        # e.g. tmpfs or ext4, which can't clone files
+        assert "Unable to clone" in str(ex)
+    else:
+        assert os.stat(str(path)).st_ino != os.stat(str(kept)).st_ino
+    assert path.read_text() == "same"
+    assert leftovers(tmp_path) == []
+
+
+def test_clone_unsupported(tmp_path, monkeypatch):
+    def reflink(src, dst):
+        raise OSError(errno.EOPNOTSUPP, os.strerror(errno.EOPNOTSUPP), dst)
+
+    monkeypatch.setattr(link, "reflink", reflink)
+    path, kept = files(tmp_path)
+    with pytest.raises(OSError, match="Unable to clone") as info:
+        link.replace(str(path), str(kept), clone=True)
+    assert info.value.errno == errno.EOPNOTSUPP
+    assert path.read_text() == "same"
+    assert leftovers(tmp_path) == []
+
+
+def test_no_temporary_file_left_after_failure(tmp_path, monkeypatch):
+    def replace(src, dst):
+        raise OSError(errno.EACCES, os.strerror(errno.EACCES), dst)
+
+    monkeypatch.setattr(link.os, "replace", replace)
+    path, kept = files(tmp_path)
+    with pytest.raises(OSError):
+        link.replace(str(path), str(kept))
+    assert path.read_text() == "same"
+    assert os.stat(str(path)).st_ino != os.stat(str(kept)).st_ino
+    assert leftovers(tmp_path) == []
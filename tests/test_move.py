@@ -0,0 +1,94 @@
+import pytest
+
+from kamaji.journal import MOVE, Journal
+from kamaji.sort import move
+from kamaji.sort.move import Mover, rename_noreplace
+from kamaji.sort.sort import PhotoSorter
+
+
+@pytest.fixture(params=["renameat2", "link"])
+def fallback(request, monkeypatch):
+    # also test the hard link fallback used without renameat2
+    if request.param == "link":
+        monkeypatch.setattr(move, "_renameat2", None)
+
+
+def test_rename_noreplace(tmp_path, fallback):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    src.write_text("src")
+    rename_noreplace(str(src), str(dst))
+    assert not src.exists()
+    assert dst.read_text() == "src"
+
+
+def test_rename_noreplace_conflict(tmp_path, fallback):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    src.write_text("src")
+    dst.write_text("dst")
+    with pytest.raises(FileExistsError):
+        rename_noreplace(str(src), str(dst))
+    assert src.read_text() == "src"
+    assert dst.read_text() == "dst"
+
+
+def test_mover_creates_directories(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "a" / "b" / "dst"
+    src.write_text("src")
+    Mover().move(str(src), str(dst))
+    assert dst.read_text() == "src"
+
+
+def test_movegroup_rolls_back_on_conflict(tmp_path):
+    srcdir, dstdir = tmp_path / "src", tmp_path / "dst"
+    srcdir.mkdir()
+    dstdir.mkdir()
+    for name in ["IMG_0001.CR2", "IMG_0001.JPG", "IMG_0001.XMP"]:
+        (srcdir / name).write_text(name)
+    # the second move of the group fails
+    (dstdir / "IMG_0001.JPG").write_text("existing")
+    moves = [
+        (str(srcdir / name), str(dstdir / name))
+        for name in ["IMG_0001.CR2", "IMG_0001.JPG", "IMG_0001.XMP"]
+    ]
+    journal = Journal(str(tmp_path / "sort.journal"))
+    sorter = PhotoSorter(journal=journal)
+    with pytest.raises(FileExistsError, match="IMG_0001.JPG"):
+        sorter.movegroup(moves)
+    journal.close()
+    assert sorted(p.name for p in srcdir.iterdir()) == [
+        "IMG_0001.CR2",
+        "IMG_0001.JPG",
+        "IMG_0001.XMP",
+    ]
+    assert [p.name for p in dstdir.iterdir()] == ["IMG_0001.JPG"]
+    assert (dstdir / "IMG_0001.JPG").read_text() == "existing"
+    # the first move was recorded as undone
+    resumed = Journal(str(tmp_path / "sort.journal"), resume=True)
+    assert not resumed.is_done(MOVE, *moves[0])
+    resumed.close()
+
+
+def test_movegroup_rollback_continues_after_a_failure(tmp_path, caplog):
+    srcdir, dstdir = tmp_path / "src", tmp_path / "dst"
+    srcdir.mkdir()
+    dstdir.mkdir()
+    names = ["IMG_0001.CR2", "IMG_0001.XMP", "IMG_0001.JPG"]
+    for name in names:
+        (srcdir / name).write_text(name)
+    (dstdir / "IMG_0001.JPG").write_text("existing")
+    moves = [(str(srcdir / name), str(dstdir / name)) for name in names]
+    sorter = PhotoSorter()
+    move = sorter.mover.move
+
+    def failing(src, dst):
+        # moving the XMP back fails
+        if src == moves[1][1]:
+            raise PermissionError("Permission denied: %s" % dst)
+        move(src, dst)
+
+    sorter.mover.move = failing
+    with pytest.raises(FileExistsError, match="IMG_0001.JPG"):
+        sorter.movegroup(moves)
+    assert sorted(p.name for p in srcdir.iterdir()) == ["IMG_0001.CR2", "IMG_0001.JPG"]
+    assert sorted(p.name for p in dstdir.iterdir()) == ["IMG_0001.JPG", "IMG_0001.XMP"]
+    assert "Unable to move" in caplog.text
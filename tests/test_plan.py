@@ -0,0 +1,132 @@
+import io
+import struct
+
+import pytest
+
+from kamaji.uniq import plan
+from kamaji.uniq.postfslint import Action, ActionType, DupGroup, DupList
+from kamaji.uniq.store import GroupStore
+
+TSV = """\
+K\t/photos/2019/IMG_0001.jpg
+D\t/backup/IMG_0001.jpg
+?\t/backup/copy of IMG_0001.jpg
+
+R\t/photos/a.jpg\t/photos/b.jpg
+L\t/backup/b.jpg\t/photos/b.jpg
+C\t/other/b.jpg\t/photos/b.jpg
+?\t/photos/ünïcode.jpg"""
+
+
+def groups():
+    return list(DupList.iter_tsv(io.StringIO(TSV)))
+
+
+def tsv(groups):
+    out = io.StringIO()
+    DupList.write_groups(out, groups)
+    return out.getvalue()[len(DupList.header) :]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "plan.bin")
+    plan.write(path, groups())
+    store = plan.PlanStore(path)
+    assert len(store) == 2
+    assert store.actions() == 7
+    assert tsv(store) == TSV
+    assert [g.annotation for g in store] == [g.annotation for g in groups()]
+    store.close()
+
+
+def test_round_trip_through_duplist(tmp_path):
+    path = str(tmp_path / "plan.bin")
+    with plan.PlanWriter(path) as writer:
+        passed = list(writer.record(groups()))
+    assert tsv(passed) == TSV
+    assert tsv(DupList(plan=path)) == TSV
+
+
+def test_annotation_is_not_written_back(tmp_path):
+    path = str(tmp_path / "plan.bin")
+    plan.write(path, groups())
+    store = plan.PlanStore(path)
+    store[0][2].type = ActionType.DELETE
+    assert store[0].annotation[2] is ActionType.DELETE
+    store.close()
+    assert tsv(plan.PlanStore(path)) == TSV
+
+
+def test_empty_plan(tmp_path):
+    path = str(tmp_path / "plan.bin")
+    plan.write(path, [])
+    assert len(plan.PlanStore(path)) == 0
+
+
+def test_type_codes_are_stable(tmp_path):
+    # the type column holds the TSV code of each action
+    path = str(tmp_path / "plan.bin")
+    plan.write(path, groups())
+    store = plan.PlanStore(path)
+    assert bytes(store.types) == b"KD?RLC?"
+    store.close()
+
+
+def test_compact_store_matches():
+    store = GroupStore(groups())
+    assert tsv(store) == TSV
+
+
+def corrupt(path, offset, data):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+
+
+def footer(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return plan.FOOTER.unpack_from(data, len(data) - plan.FOOTER.size)
+
+
+def test_rejects_unknown_type(tmp_path):
+    path = str(tmp_path / "plan.bin")
+    plan.write(path, groups())
+    types = footer(path)[2]
+    corrupt(path, types + 1, b"X")
+    with pytest.raises(ValueError, match="unknown action type 'X' at action 1"):
+        plan.PlanStore(path)
+
+
+def test_rejects_missing_argument(tmp_path):
+    path = str(tmp_path / "plan.bin")
+    plan.write(path, groups())
+    args = footer(path)[4]
+    # the RENAME is action 3
+    corrupt(path, args + 8 * 3, struct.pack("<Q", plan.NO_ARG))
+    with pytest.raises(ValueError, match="wrong number of arguments for action 3"):
+        plan.PlanStore(path)
+
+
+def test_rejects_unexpected_argument(tmp_path):
+    path = str(tmp_path / "plan.bin")
+    plan.write(path, [DupGroup([Action(ActionType.KEEP, "a")])])
+    args = footer(path)[4]
+    corrupt(path, args, struct.pack("<Q", len(plan.MAGIC)))
+    with pytest.raises(ValueError, match="unexpected argument for action 0"):
+        plan.PlanStore(path)
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "plan.tsv"
+    path.write_text(TSV)
+    with pytest.raises(ValueError, match="not a binary plan"):
+        plan.PlanStore(str(path))
+
+
+def test_rejects_other_versions(tmp_path):
+    path = str(tmp_path / "plan.bin")
+    plan.write(path, groups())
+    corrupt(path, 6, struct.pack("<H", 99))
+    with pytest.raises(ValueError, match="unsupported binary plan version 99"):
+        plan.PlanStore(path)
@@ -0,0 +1,74 @@
+import copy
+import os
+import random
+
+from kamaji.uniq.postfslint import Action, ActionType, DupGroup
+from kamaji.uniq.rules import RuleSet, rule_re, rule_specificity
+
+
+def group(*paths):
+    return DupGroup([Action(ActionType.UNKNOWN, path) for path in paths])
+
+
+def types(group):
+    return "".join(action.type.value for action in group)
+
+
+def test_regex_rules_are_merged():
+    rules = RuleSet([rule_re("foo"), rule_re("bar")])
+    assert len(rules) == 1
+    g = group("/foo/a", "/bar/a", "/baz/a")
+    rules.annotate_batch([g])
+    assert types(g) == "KK?"
+
+
+def test_inline_global_flags_are_not_merged():
+    rules = RuleSet([rule_re("(?i)foo"), rule_re("bar")])
+    assert len(rules) == 2
+    g = group("/FOO/a", "/BAR/a", "/baz/a")
+    rules.annotate_batch([g])
+    assert types(g) == "KK?"
+    # scoped flags are fine
+    assert len(RuleSet([rule_re("(?i:foo)"), rule_re("bar")])) == 1
+
+
+def pairwise_specificity(actions):
+    # the original O(n^2) rule_specificity, also timed by bench_specificity.py
+    dirnames = [os.path.dirname(a.path) for a in actions]
+    for i in range(len(actions) - 1):
+        for j in range(i + 1, len(actions)):
+            common = os.path.commonpath([dirnames[i], dirnames[j]])
+            if dirnames[i] != dirnames[j]:
+                if common == dirnames[i]:
+                    if actions[i].type == ActionType.UNKNOWN:
+                        actions[i].type = ActionType.DELETE
+                elif common == dirnames[j]:
+                    if actions[j].type == ActionType.UNKNOWN:
+                        actions[j].type = ActionType.DELETE
+    return True
+
+
+def random_group(rng):
+    root = rng.choice(["/", ""])
+    paths = []
+    for i in range(rng.randint(1, 8)):
+        parts = [
+            rng.choice(["a", "b", "ab", ".", ""]) for j in range(rng.randint(1, 4))
+        ]
+        path = "/".join(parts[:-1] + ["f{}.jpg".format(i)])
+        paths.append(root + path.lstrip("/"))
+    group = DupGroup([Action(ActionType.UNKNOWN, path) for path in paths])
+    for action in group:
+        if rng.random() < 0.2:
+            action.type = ActionType.KEEP
+    return group
+
+
+def test_specificity_matches_pairwise():
+    rng = random.Random(0)
+    for n in range(2000):
+        group = random_group(rng)
+        expected = copy.deepcopy(group)
+        pairwise_specificity(expected)
+        rule_specificity(group)
+        assert types(group) == types(expected), [a.path for a in group]
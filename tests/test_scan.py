@@ -0,0 +1,112 @@
+import errno
+import logging
+import os
+
+from kamaji.uniq import scan
+from kamaji.uniq.scan import BLOCK, find_duplicates, walk
+
+
+def write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def groups(paths, **kwargs):
+    return [sorted(a.path for a in group) for group in find_duplicates(paths, **kwargs)]
+
+
+def spy(monkeypatch, name):
+    """Record the paths hashed by a function of scan"""
+    calls = []
+    func = getattr(scan, name)
+
+    def wrapper(path, *args):
+        calls.append(path)
+        return func(path, *args)
+
+    monkeypatch.setattr(scan, name, wrapper)
+    return calls
+
+
+def test_unique_sizes_are_not_hashed(tmp_path, monkeypatch):
+    partial = spy(monkeypatch, "partial_hash")
+    a = write(tmp_path / "a", b"abc")
+    b = write(tmp_path / "b", b"abc")
+    write(tmp_path / "c", b"abcd")
+    write(tmp_path / "empty", b"")
+    assert groups([str(tmp_path)]) == [[a, b]]
+    assert sorted(partial) == [a, b]
+
+
+def test_partial_hash_splits_small_files(tmp_path, monkeypatch):
+    full = spy(monkeypatch, "full_hash")
+    a = write(tmp_path / "a", b"abc")
+    b = write(tmp_path / "b", b"abc")
+    write(tmp_path / "c", b"abd")
+    assert groups([str(tmp_path)]) == [[a, b]]
+    # covered completely by the partial hash
+    assert full == []
+
+
+def test_full_hash_splits_large_files(tmp_path, monkeypatch):
+    full = spy(monkeypatch, "full_hash")
+    data = bytearray(3 * BLOCK)
+    a = write(tmp_path / "a", bytes(data))
+    b = write(tmp_path / "b", bytes(data))
+    # only the middle differs, which the partial hash doesn't read
+    data[BLOCK + 10] = 1
+    c = write(tmp_path / "c", bytes(data))
+    d = write(tmp_path / "d", bytes(reversed(data)) + b"x")
+    assert groups([str(tmp_path)]) == [[a, b]]
+    assert sorted(full) == [a, b, c]
+    assert d not in full
+
+
+def test_largest_groups_first(tmp_path):
+    small = [write(tmp_path / name, b"s") for name in "ab"]
+    large = [write(tmp_path / name, b"l" * 3 * BLOCK) for name in "cd"]
+    assert groups([str(tmp_path)]) == [large, small]
+
+
+def test_unreadable_files_are_dropped(tmp_path, monkeypatch, caplog):
+    a = write(tmp_path / "a", b"abc")
+    b = write(tmp_path / "b", b"abc")
+    c = write(tmp_path / "c", b"abc")
+    partial_hash = scan.partial_hash
+
+    def unreadable(path, size):
+        if path == c:
+            raise PermissionError(errno.EACCES, os.strerror(errno.EACCES), path)
+        return partial_hash(path, size)
+
+    monkeypatch.setattr(scan, "partial_hash", unreadable)
+    with caplog.at_level(logging.WARNING):
+        assert groups([str(tmp_path)]) == [[a, b]]
+    assert c in caplog.text
+
+
+def test_missing_paths_are_logged(tmp_path, caplog):
+    with caplog.at_level(logging.WARNING):
+        assert list(walk([str(tmp_path / "missing")])) == []
+    assert "missing" in caplog.text
+
+
+def test_hard_links_are_listed_once(tmp_path):
+    a = write(tmp_path / "a", b"abc")
+    os.link(a, str(tmp_path / "b"))
+    assert [path for path, st in walk([str(tmp_path)])] == [a]
+    assert groups([str(tmp_path)]) == []
+
+
+def test_symlinks_are_not_followed(tmp_path):
+    a = write(tmp_path / "dir" / "a", b"abc")
+    os.symlink(a, str(tmp_path / "link"))
+    os.symlink(str(tmp_path / "dir"), str(tmp_path / "dirlink"))
+    assert [path for path, st in walk([str(tmp_path)])] == [a]
+    assert groups([str(tmp_path)]) == []
+
+
+def test_walk_order(tmp_path):
+    paths = [write(tmp_path / name, b"") for name in ["b/2", "a", "b/1", "c"]]
+    assert [path for path, st in walk([str(tmp_path)])] == sorted(paths)
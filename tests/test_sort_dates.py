@@ -0,0 +1,45 @@
+import json
+import logging
+
+from kamaji.sort.sort import PhotoSorter
+
+
+def test_parse():
+    dates = {"a.jpg": set(), "b.jpg": set()}
+    output = json.dumps(
+        [
+            {
+                "SourceFile": "a.jpg",
+                "CreateDate": "2019:03",
+                "DateTimeOriginal": "2019:04",
+            },
+            {"SourceFile": "b.jpg"},
+            {"SourceFile": "other.jpg", "CreateDate": "2020:01"},
+        ]
+    )
+    assert PhotoSorter._parse(output, dates) == {"a.jpg", "b.jpg"}
+    assert dates == {"a.jpg": {("2019", "03"), ("2019", "04")}, "b.jpg": set()}
+
+
+def test_parse_error_record(caplog):
+    dates = {"a.jpg": set()}
+    output = json.dumps([{"SourceFile": "a.jpg", "Error": "File format error"}])
+    with caplog.at_level(logging.WARNING):
+        assert PhotoSorter._parse(output, dates) == set()
+    assert dates == {"a.jpg": set()}
+    assert "File format error" in caplog.text
+
+
+def test_parse_empty_or_invalid_output(caplog):
+    dates = {"a.jpg": set()}
+    assert PhotoSorter._parse("", dates) == set()
+    assert PhotoSorter._parse("Error: File not found - a.jpg\n", dates) == set()
+    assert dates == {"a.jpg": set()}
+    assert "Unable to parse exiftool output" in caplog.text
+
+
+def test_unread_files_are_not_cached(caplog):
+    uncached = {"a.jpg": None, "b.jpg": None}
+    PhotoSorter._unread(["a.jpg", "b.jpg"], {"a.jpg"}, uncached)
+    assert list(uncached) == ["a.jpg"]
+    assert "Unable to read dates from b.jpg" in caplog.text
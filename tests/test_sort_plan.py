@@ -0,0 +1,39 @@
+import io
+
+from kamaji.sort.plan import read_plan, write_plan
+
+GROUPS = [
+    [
+        ("/in/IMG_1.JPG", "/out/2019/IMG_1.JPG"),
+        ("/in/IMG_1.CR2", "/out/2019/IMG_1.CR2"),
+    ],
+    [("/in/IMG_2.JPG", "/out/2020/IMG_2.JPG")],
+]
+
+
+def test_round_trip():
+    out = io.StringIO()
+    write_plan(out, GROUPS)
+    assert list(read_plan(io.StringIO(out.getvalue()))) == GROUPS
+
+
+def test_keep_skips_the_group():
+    out = io.StringIO()
+    write_plan(out, GROUPS)
+    # keep the RAW file: its JPG must stay with it
+    plan = out.getvalue().replace("R\t/in/IMG_1.CR2", "K\t/in/IMG_1.CR2")
+    assert list(read_plan(io.StringIO(plan))) == GROUPS[1:]
+    plan = out.getvalue().replace(
+        "R\t/in/IMG_2.JPG\t/out/2020/IMG_2.JPG", "K\t/in/IMG_2.JPG"
+    )
+    assert list(read_plan(io.StringIO(plan))) == GROUPS[:1]
+
+
+def test_parse_error_skips_the_group():
+    plan = (
+        "R\t/in/IMG_1.JPG\t/out/2019/05/IMG_1.JPG\n"
+        "R /in/IMG_1.CR2 /out/2019/05/IMG_1.CR2\n"
+        "\n"
+        "R\t/in/IMG_2.JPG\t/out/2020/IMG_2.JPG\n"
+    )
+    assert list(read_plan(io.StringIO(plan))) == GROUPS[1:]
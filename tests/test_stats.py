@@ -0,0 +1,81 @@
+import io
+import json
+
+import pytest
+
+from kamaji import stats
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Enabled statistics, with a clock advanced by tick()"""
+    now = [0.0]
+    monkeypatch.setattr(stats.time, "perf_counter", lambda: now[0])
+
+    def tick(seconds):
+        now[0] += seconds
+
+    stats.reset()
+    stats.enable()
+    yield tick
+    stats.disable()
+    stats.reset()
+
+
+def test_disabled_is_a_no_op():
+    assert not stats.enabled
+    items = [1, 2]
+    assert stats.iterate("items", items) is items
+    with stats.timer("block"):
+        stats.count("things")
+    assert stats.summary() == {"wall": 0.0, "timers": {}, "counters": {}}
+
+
+def test_timers_nest(clock):
+    with stats.timer("outer"):
+        clock(1)
+        for i in range(2):
+            with stats.timer("inner"):
+                clock(2)
+        clock(3)
+    assert stats.summary()["timers"] == {
+        "outer": {"calls": 1, "total": 8.0, "self": 4.0},
+        "inner": {"calls": 2, "total": 4.0, "self": 4.0},
+    }
+
+
+def test_iterate(clock):
+    def source():
+        for i in range(3):
+            clock(1)
+            yield i
+
+    def double(items):
+        for i in items:
+            clock(2)
+            yield i * 2
+
+    pipeline = stats.iterate("double", double(stats.iterate("source", source())))
+    assert list(pipeline) == [0, 2, 4]
+    timers = stats.summary()["timers"]
+    # one call per item, plus the one stopping the iteration
+    assert timers["source"] == {"calls": 4, "total": 3.0, "self": 3.0}
+    assert timers["double"] == {"calls": 4, "total": 9.0, "self": 6.0}
+
+
+def test_counters_and_report(clock, tmp_path):
+    stats.count("files")
+    stats.count("files", 2)
+    stats.count("bytes", 100)
+    clock(5)
+    data = stats.summary()
+    assert data["counters"] == {"files": 3, "bytes": 100}
+    assert data["wall"] == 5.0
+    out = io.StringIO()
+    stats.report(out)
+    assert out.getvalue().splitlines()[0] == "Wall time: 5.000s"
+    stats.write_json(str(tmp_path / "stats.json"))
+    with open(str(tmp_path / "stats.json")) as f:
+        assert json.load(f) == data
+    stats.reset()
+    assert stats.summary()["counters"] == {}
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from kamaji.sort.walk import compile_globs, walk
+
+
+@pytest.fixture
+def tree(tmp_path):
+    src = tmp_path / "src"
+    for path in [
+        "IMG_1.JPG",
+        "Thumbs.db",
+        "a/IMG_2.JPG",
+        "a/b/IMG_3.CR2",
+        "a/.git/config",
+        "c/IMG_4.JPG",
+        "sorted/2019/03/IMG_5.JPG",
+        "sorted/2019/notes.txt",
+    ]:
+        (src / path).parent.mkdir(parents=True, exist_ok=True)
+        (src / path).write_text(path)
+    return src
+
+
+def listing(it):
+    return [(dirpath, sorted(filenames)) for dirpath, filenames in it]
+
+
+def test_matches_os_walk(tree):
+    os.symlink(str(tree / "a"), str(tree / "link"))
+    os.symlink(str(tree / "IMG_1.JPG"), str(tree / "c" / "IMG_1.JPG"))
+    dst = str(tree.parent / "dst")
+    assert listing(walk(str(tree), dst)) == listing(
+        (dirpath, filenames) for dirpath, dirnames, filenames in os.walk(str(tree))
+    )
+
+
+def test_not_recursive(tree):
+    assert listing(walk(str(tree), str(tree), recursive=False)) == [
+        (str(tree), ["IMG_1.JPG", "Thumbs.db"])
+    ]
+
+
+def test_blacklist(tree):
+    dirs = dict(listing(walk(str(tree), "/nowhere", blacklist=["*.db", ".git"])))
+    assert dirs[str(tree)] == ["IMG_1.JPG"]
+    assert str(tree / "a" / ".git") not in dirs
+    assert str(tree / "a" / "b") in dirs
+
+
+def test_skips_destination_months(tree):
+    dirs = dict(listing(walk(str(tree), str(tree / "sorted"))))
+    assert dirs[str(tree / "sorted" / "2019")] == ["notes.txt"]
+    assert str(tree / "sorted" / "2019" / "03") not in dirs
+
+
+def test_compile_globs():
+    assert compile_globs([]) is None
+    pattern = compile_globs(["*.db", ".git", "IMG_?.XMP"])
+    assert [bool(pattern.match(name)) for name in ["a.db", ".git", "IMG_1.XMP"]] == [
+        True,
+        True,
+        True,
+    ]
+    assert not pattern.match(".gitignore")
+    assert not pattern.match("IMG_10.XMP")